@@ -2,15 +2,108 @@
 The kernel: stepping and calling.
 """
 
-tracing = False
+from collections import deque
+import weakref
+
+# The trampoline runs in slices of time_slice steps. Between slices it
+# lets the next runnable process have a turn (see process.py): a
+# process's state is just a suspended trampoline state, so switching
+# processes swaps one state for another. A sampler, when set, also gets
+# called there with the current continuation. (See profiler.py.)
+#
+# Each state carries its owner: a forked process, or the Main
+# computation a trampoline call was asked to run. (That call's state
+# may have been partly computed already, so the Main to own it must be
+# in place beforehand.) An owner stops being alive when it finishes or
+# fails, and then any states of its still parked somewhere get dropped
+# instead of run. An error fails only its own process: in a forked one
+# it gets reported and the others carry on.
+
+time_slice = 200
+runnable = deque()              # (owner, k, value) awaiting a turn.
+sampler = None
+
+class Main(object):
+    __slots__ = ('alive',)
+    def __init__(self):
+        self.alive = True
+
+main = Main()                   # The owner for the next state to run.
+current = main                  # The owner of the running state.
 
 def trampoline(state):
-    k, value = state
-    while k is not None:
-#        traceback((k, value))
-        fn, free_var, k = k
-        k, value = fn(value, free_var, k)
-    return value
+    run = Run(state)
+    run.advance()
+    return run.value
+
+class Run(object):
+    """A computation on the trampoline that can be advanced a few
+    slices at a time, leaving the caller free to do other things in
+    between, or be abandoned."""
+
+    def __init__(self, state):
+        global main, current
+        self.main, self.current = main, current
+        self.k, self.value = state
+        main = current = Main()
+
+    def advance(self, slices=-1):
+        "Run for that many slices (or with -1, to the end); say if done."
+        global current
+        current = self.current
+        k, value = self.k, self.value
+        try:
+            while k is not None:
+                try:
+                    for _ in xrange(time_slice):
+                        fn, free_var, k = k
+                        k, value = fn(value, free_var, k)
+                        if k is None: break
+                    else:
+                        if sampler is not None:
+                            sampler(k)
+                        if runnable:
+                            runnable.append((current, k, value))
+                            k, value = switch()
+                        slices -= 1
+                        if not slices: break
+                except Exception, e:
+                    if current is self.main: raise
+                    current.fail(e)     # A forked process: the rest go on.
+                    k, value = switch()
+        except:
+            current.alive = False
+            self.main.alive = False
+            self.k = None
+            raise
+        finally:
+            self.current, current = current, main
+        self.k, self.value = k, value
+        if k is None:
+            self.main.alive = False
+        return k is None
+
+    def abort(self):
+        "Give up on the computation (but not on other processes)."
+        if self.k is not None and self.current is not self.main:
+            runnable.append((self.current, self.k, self.value))
+        self.main.alive = False
+        self.k = None
+
+def switch():
+    "Return the state to continue with once the current process blocks."
+    global current
+    while runnable:
+        owner, k, value = runnable.popleft()
+        if owner.alive:
+            current = owner
+            return k, value
+    raise Exception("Deadlock: no process can run")
+
+def ending_k(value, process, _):
+    "The last continuation of a forked process."
+    process.finish(value)
+    return switch()
 
 final_k = None
 
@@ -26,19 +119,48 @@ def traceback(state):
             print '%-18s %r' % (fn.__name__, free_var)
 
 def call(receiver, selector, args, k):
-    if tracing:
-        print '.... %14s %r' % (selector, receiver)
-    return get_class(receiver).get_method(selector)(receiver, args, k)
+    class_ = get_class(receiver)
+    method = class_.get_method(selector)
+    if watching:
+        k = watched(class_, selector, receiver, k)
+    return method(receiver, args, k)
+
+# Watchers see every send, just before the method runs. Each is called
+# as watcher(class_, selector, receiver, k) and returns the continuation
+# to give the method -- k itself, or k wrapped to notice the return.
+
+watchers = []
+watching = False
+
+def watched(class_, selector, receiver, k):
+    for watcher in watchers:
+        k = watcher(class_, selector, receiver, k)
+    return k
+
+def add_watcher(watcher):
+    global watching
+    if watcher not in watchers:
+        watchers.append(watcher)
+    if not watching:
+        watching = True
+        check_guards()
+
+def remove_watcher(watcher):
+    global watching
+    if watcher in watchers:
+        watchers.remove(watcher)
+    if watching and not watchers:
+        watching = False
+        check_guards()
 
 def get_class(x):
+    class_ = class_from_type.get(type(x))
+    if class_ is not None:
+        return class_
     try:
         return x.class_         # TODO maybe call this .hiss_class or something instead
     except AttributeError:
         pass
-    try:
-        return class_from_type[type(x)]
-    except KeyError:
-        pass
     import primitive
     if isinstance(x, bool):
         return primitive.true_class if x else primitive.false_class
@@ -47,3 +169,110 @@ def get_class(x):
     assert False, "Classless datum"
 
 class_from_type = {} # Filled in by the other modules which define the classes.
+
+
+# Inline caches. Each send in compiled code owns a SendSite remembering
+# the methods it has found, keyed by receiver class: one (class, method)
+# pair while monomorphic, then a short list of them while polymorphic.
+# Past that the site is megamorphic and just looks the method up each
+# time. (Classes compare by value, so the pairs are matched with 'is'.)
+
+polymorphic_limit = 8
+
+sites = {}  # selector -> the live SendSites sending it
+
+class SendSite(object):
+    __slots__ = ('selector', 'node', 'class_', 'method', 'entries',
+                 'hits', 'misses', '__weakref__')
+    def __init__(self, selector, node=None):
+        self.selector = selector
+        self.node = node        # The AST node, just for reports.
+        self.hits = self.misses = 0
+        self.flush()
+        sites.setdefault(selector, weakref.WeakSet()).add(self)
+    def flush(self):
+        self.class_ = self.method = self.entries = None
+    def send(self, receiver, args, k):
+        class_ = get_class(receiver)
+        if class_ is self.class_:
+            self.hits += 1
+            if watching:
+                k = watched(class_, self.selector, receiver, k)
+            return self.method(receiver, args, k)
+        return self.miss(class_, receiver, args, k)
+    def miss(self, class_, receiver, args, k):
+        method = self.lookup(class_)
+        if watching:
+            k = watched(class_, self.selector, receiver, k)
+        return method(receiver, args, k)
+    def lookup(self, class_):
+        entries = self.entries
+        if entries is not None:
+            for cached_class, method in entries:
+                if cached_class is class_:
+                    self.hits += 1
+                    return method
+        self.misses += 1
+        method = class_.get_method(self.selector)
+        if self.class_ is None:
+            self.class_, self.method = class_, method
+        else:
+            if entries is None:
+                entries = self.entries = []
+            if len(entries) < polymorphic_limit:
+                entries.append((class_, method))
+        return method
+    def state(self):
+        if self.class_ is None: return 'empty'
+        if self.entries is None: return 'monomorphic'
+        if len(self.entries) < polymorphic_limit: return 'polymorphic'
+        return 'megamorphic'
+
+# A Guard is a precondition on method tables that compiled code can
+# test cheaply, for code specialized on the assumption that some
+# methods are still the usual ones. It's rechecked on every change to
+# the methods for its selector, and whenever watching starts or stops:
+# the specialized code skips the send, so the watchers wouldn't see it.
+
+guards = {}  # selector -> the Guards depending on methods for it
+
+class Guard(object):
+    __slots__ = ('ok', 'test')
+    def __init__(self, selector, test):
+        self.test = test
+        self.check()
+        guards.setdefault(selector, []).append(self)
+    def check(self):
+        self.ok = bool(self.test())
+
+def methods_changed(selector=None):
+    "Note that the methods for selector (or for anything) may have changed."
+    flush_sites(selector)
+    check_guards(selector)
+
+def check_guards(selector=None):
+    "Recheck the guards on selector (or on anything)."
+    if selector is None:
+        groups = guards.values()
+    else:
+        groups = [guards.get(selector, ())]
+    for group in groups:
+        for guard in group:
+            guard.check()
+
+def flush_sites(selector=None):
+    "Forget cached methods for selector (or for all selectors)."
+    if selector is None:
+        groups = sites.values()
+    else:
+        groups = [sites.get(selector, ())]
+    for group in groups:
+        for site in group:
+            site.flush()
+
+def send_site_stats():
+    "Return (selector, node, hits, misses, state) for each live send site."
+    return [(site.selector, site.node, site.hits, site.misses, site.state())
+            for group in sites.values()
+            for site in group
+            if site.hits or site.misses]
@@ -2,7 +2,7 @@
 Hacked up from https://github.com/darius/sketchbook/tree/master/editor
 """
 
-import re, sys
+import os, re, select, sys
 
 import ansi
 
@@ -13,6 +13,7 @@ class UI(object):
         self.buffers = buffers
         self.current_buffer = 0
         self.killed = ''
+        self.job = None         # Work to do a bit at a time while idle.
 
     @property
     def buf(self):
@@ -23,7 +24,7 @@ class UI(object):
             buf.redisplay()
         while True:
             self.buf.redisplay()
-            key = read_key()
+            key = self.read_key()
             if key in ('', C('x'), C('q')):
                 break
             last_buf = self.buf
@@ -33,6 +34,28 @@ class UI(object):
             for buf in self.buffers:
                 buf.save()
 
+    # A job has a method advance(), to do a little more of its work and
+    # return true once it's finished, and abort().
+
+    def read_key(self):
+        "Wait for a key, meanwhile advancing the job, if any."
+        while self.job is not None and not key_ready():
+            if self.job.advance():
+                self.job = None
+                for buf in self.buffers:
+                    if buf is not self.buf: buf.redisplay()
+                self.buf.redisplay()
+        return read_key()
+
+    def start_job(self, job):
+        self.abort_job()
+        self.job = job
+
+    def abort_job(self):
+        if self.job is not None:
+            self.job, job = None, self.job
+            job.abort()
+
 class Buffer(object):
     "A pane of editable text on screen."
 
@@ -223,6 +246,9 @@ def start_of_buffer(buf): buf.point = 0
 @bind(M('>'))
 def end_of_buffer(buf): buf.point = len(buf.text)
 
+@bind(C('g'))
+def abort_job(buf): buf.ui.abort_job()
+
 @bind(C('k'))
 def kill_line(buf): buf.kill_line()
 
@@ -245,10 +271,17 @@ keys = {
 }
 key_prefixes = set(k[:i] for k in keys for i in range(1, len(k)))
 
+def key_ready():
+    return bool(select.select([sys.stdin], [], [], 0)[0])
+
+# Read the fd directly, so no input hides in a stdio buffer from select().
+def read_char():
+    return os.read(sys.stdin.fileno(), 1)
+
 def read_key():
-    k = sys.stdin.read(1)
+    k = read_char()
     while k in key_prefixes:
-        k1 = sys.stdin.read(1)
+        k1 = read_char()
         if not k1: break
         k += k1
     return keys.get(k, k)
@@ -0,0 +1,337 @@
+"""
+A hand-written recursive-descent parser for the language of
+parser.grammar, building the very same ASTs with the same semantic
+actions, only faster. It returns None for any text it can't parse;
+parser.py then falls back to the grammar, which can say where the
+trouble is.
+
+The tokens depend on context -- a '|' may start a binary selector or
+bracket the locals, a '-' may be a selector or a number's sign -- so
+rather than tokenizing in a separate pass, each token gets scanned
+where the parser expects one, by a regex matched at that position.
+Messages parse by precedence, unary over binary over keyword.
+"""
+
+import re
+
+import parser as actions
+import terp
+
+whitespace_re = re.compile(r"(?:\s|--[>|\s][^\n]*|###[\s\S]*)*")
+id_re         = re.compile(r"[A-Za-z][_A-Za-z0-9-]*")
+number_re     = re.compile(r"-?\d+(?:[.]\d+)?(?:e-?\d+)?")
+binary_re     = re.compile(r"[~!@%&*\-+=|\\<>,?\/]+")
+word_char_re  = re.compile(r"\w")
+
+reserved = {
+    'nil':   actions.mk_nil,
+    'false': actions.mk_false,
+    'true':  actions.mk_true,
+    'I':     actions.mk_self,
+    'me':    actions.mk_self,
+}
+
+def top_code(text):
+    "Like grammar.top_code(text), or None."
+    p = Parser(text)
+    r = p.code(p.skip(0))
+    if r is None or r[0] != len(text): return None
+    return r[1]
+
+def top_method(text):
+    "Like grammar.top_method(text), or None."
+    p = Parser(text)
+    r = p.method_decl(0)
+    if r is None or r[0] != len(text): return None
+    return (r[1],)
+
+def method_header(text):
+    "Like grammar.method_header(text), or None."
+    r = Parser(text).method_header(0)
+    return None if r is None else (r[1],)
+
+# Each parsing method takes a position and returns None on failure, or
+# else (the position after, the value). A token swallows any whitespace
+# after it.
+
+class Parser(object):
+
+    def __init__(self, text):
+        self.text = text
+
+    def skip(self, i):
+        return whitespace_re.match(self.text, i).end()
+
+    def literal(self, i, s):
+        if self.text.startswith(s, i):
+            return self.skip(i + len(s))
+        return None
+
+    def dot(self, i):
+        if (self.text.startswith('.', i)
+                and not word_char_re.match(self.text, i + 1)):
+            return self.skip(i + 1)
+        return None
+
+    def id(self, i):
+        m = id_re.match(self.text, i)
+        return m and m.group()
+
+    def name(self, i):
+        word = self.id(i)
+        if word is None or word in reserved or word == 'my':
+            return None
+        return self.skip(i + len(word)), word
+
+    def my(self, i):
+        "The position after 'my' and the whitespace it needs, or None."
+        if not self.text.startswith('my', i): return None
+        j = self.skip(i + 2)
+        return j if j != i + 2 else None
+
+    def unary(self, i):
+        word = self.id(i)
+        if word is None: return None
+        j = i + len(word)
+        if self.text.startswith(':', j): return None
+        return self.skip(j), word
+
+    def keyword(self, i):
+        word = self.id(i)
+        if word is None: return None
+        j = i + len(word)
+        if not self.text.startswith(':', j): return None
+        return self.skip(j + 1), word + ':'
+
+    def binary(self, i):
+        m = binary_re.match(self.text, i)
+        if m is None: return None
+        return self.skip(m.end()), m.group()
+
+    # Methods
+
+    def method_header(self, i):
+        r = self.unary(i)
+        if r:
+            return r[0], actions.mk_unary_header(r[1])
+        r = self.binary(i)
+        if r:
+            r2 = self.name(r[0])
+            if r2:
+                return r2[0], actions.mk_binary_header(r[1], r2[1])
+        parts = []
+        while True:
+            r = self.keyword(i)
+            if not r: break
+            r2 = self.name(r[0])
+            if not r2: break
+            i = r2[0]
+            parts += [r[1], r2[1]]
+        if parts:
+            return i, actions.mk_keyword_header(*parts)
+        return None
+
+    def method_decl(self, i):
+        r = self.method_header(i)
+        if r is None: return None
+        i, header = r
+        i, (localvars, expr) = self.code(i)
+        return i, actions.mk_method(header, localvars, expr)
+
+    # Code and statements
+
+    def code(self, i):
+        "(Never fails: the statements may be empty.)"
+        localvars = ()
+        j = self.literal(i, '|')
+        if j is not None:
+            names = []
+            while True:
+                r = self.name(j)
+                if r is None: break
+                j, name = r
+                names.append(name)
+            j = self.literal(j, '|')
+            if j is not None:
+                i, localvars = j, tuple(names)
+        r = self.stmts(i)
+        if r is None:
+            return i, (localvars, actions.mk_nil())
+        return r[0], (localvars, r[1])
+
+    def stmts(self, i):
+        r = self.stmt(i)
+        if r is None: return None
+        i, e = r
+        while True:
+            j = self.dot(i)
+            if j is None: break
+            r = self.stmt(j)
+            if r is None: break
+            i, e = r[0], actions.mk_then(e, r[1])
+        j = self.dot(i)
+        return (i if j is None else j), e
+
+    def stmt(self, i):
+        j = self.my(i)
+        if j is not None:
+            r = self.assignment(j)
+            if r: return r[0], actions.mk_slot_put(*r[1])
+        r = self.assignment(i)
+        if r: return r[0], actions.mk_local_put(*r[1])
+        j = self.literal(i, '^')
+        if j is not None:
+            r = self.expr(j)
+            if r: return r[0], actions.mk_return(r[1])
+        return self.expr(i)
+
+    def assignment(self, i):
+        r = self.name(i)
+        if r is None: return None
+        j = self.literal(r[0], ':=')
+        if j is None: return None
+        r2 = self.expr(j)
+        if r2 is None: return None
+        return r2[0], (r[1], r2[1])
+
+    # Expressions
+
+    def expr(self, i):
+        r = self.operand(i)
+        if r is None: return None
+        i, receiver = r
+        while True:
+            r = self.messages(i, receiver)
+            if r is None: return i, receiver
+            i, send = r
+            j = self.literal(i, ';')
+            if j is None: return i, send
+            i, receiver = j, terp.make_cascade(send.subject, send.selector,
+                                               send.operands)
+
+    def messages(self, i, e):
+        "Parse unary*, binary*, keyword? messages to e; None if there are none."
+        start = i
+        while True:
+            r = self.unary(i)
+            if r is None: break
+            i, e = r[0], terp.make_send(e, r[1], ())
+        while True:
+            r = self.binary(i)
+            if r is None: break
+            r2 = self.e1(r[0])
+            if r2 is None: break
+            i, e = r2[0], terp.make_send(e, r[1], (r2[1],))
+        parts, args = [], []
+        while True:
+            r = self.keyword(i)
+            if r is None: break
+            r2 = self.e2(r[0])
+            if r2 is None: break
+            parts.append(r[1])
+            i = r2[0]
+            args.append(r2[1])
+        if parts:
+            e = terp.make_send(e, ''.join(parts), tuple(args))
+        return None if i == start else (i, e)
+
+    def e1(self, i):
+        r = self.operand(i)
+        if r is None: return None
+        i, e = r
+        while True:
+            r = self.unary(i)
+            if r is None: return i, e
+            i, e = r[0], terp.make_send(e, r[1], ())
+
+    def e2(self, i):
+        r = self.e1(i)
+        if r is None: return None
+        i, e = r
+        while True:
+            r = self.binary(i)
+            if r is None: return i, e
+            r2 = self.e1(r[0])
+            if r2 is None: return i, e
+            i, e = r2[0], terp.make_send(e, r[1], (r2[1],))
+
+    def operand(self, i):
+        text = self.text
+        c = text[i:i+1]
+        if c == '{':
+            return self.block(self.skip(i + 1))
+        word = self.id(i)
+        if word is not None:
+            if word in reserved:
+                return self.skip(i + len(word)), reserved[word]()
+            j = self.my(i) if word == 'my' else None
+            if j is not None:
+                r = self.name(j)
+                if r: return r[0], actions.mk_slot_get(r[1])
+            r = self.name(i)
+            if r: return r[0], actions.mk_var_get(r[1])
+            return None
+        m = number_re.match(text, i)
+        if m:
+            return self.skip(m.end()), actions.mk_num(m.group())
+        if c == "'":
+            return self.string(i)
+        if c == '(':
+            r = self.stmt(self.skip(i + 1))
+            if r is None: return None
+            j = self.literal(r[0], ')')
+            if j is None: return None
+            return j, r[1]
+        if c == '[':
+            return self.array(self.skip(i + 1))
+        return None
+
+    def string(self, i):
+        text = self.text
+        j = i + 1
+        while True:
+            j = text.find("'", j)
+            if j == -1: return None
+            if not text.startswith("''", j): break
+            j += 2
+        return self.skip(j + 1), actions.mk_string(text[i+1:j].replace("''", "'"))
+
+    def block(self, i):
+        params = []
+        j = i
+        while True:
+            k = self.literal(j, ':')
+            if k is None: break
+            r = self.name(k)
+            if r is None: break
+            j, param = r
+            params.append(param)
+        if params:
+            k = self.literal(j, '|')
+            if k is not None:
+                i = k
+            else:
+                params = []
+        i, (localvars, expr) = self.code(i)
+        j = self.literal(i, '}')
+        if j is None: return None
+        return j, actions.mk_block(tuple(params), localvars, expr)
+
+    def array(self, i):
+        exprs = []
+        r = self.expr(i)
+        if r is not None:
+            i, e = r
+            exprs.append(e)
+            while True:
+                j = self.dot(i)
+                if j is None: break
+                r = self.expr(j)
+                if r is None: break
+                i, e = r
+                exprs.append(e)
+        j = self.dot(i)
+        if j is not None: i = j
+        j = self.literal(i, ']')
+        if j is None: return None
+        return j, actions.mk_array(tuple(exprs))
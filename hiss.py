@@ -2,16 +2,37 @@
 Tie together the parser and interpreter.
 """
 
-import core, fileout, primitive, parser, terp
+import core, fileout, image, journal, primitive, parser, process, profiler, streams, terp, typedarray
 
 saving_changes = False
-changes = open('changes.hiss', 'a')
+changes = journal.Journal('changes.hiss')
 
-def start_up():
+image_file = 'hiss.image'
+
+def start_up(check=False, use_image=True, save_changes=True):
     global saving_changes
     saving_changes = False
-    load_file('startup.hiss')
-    saving_changes = True
+    if not (use_image and load_image()):
+        load_file('startup.hiss')
+        if use_image:
+            try:
+                image.save(image_file)
+            except Exception:
+                pass            # We'll just load startup.hiss again next time.
+    saving_changes = save_changes
+    if check:
+        print_bad_methods()
+
+def load_image():
+    "Load the image if it's up to date and sound; say if it was."
+    if not image.is_fresh(image_file, ['startup.hiss']):
+        return False
+    try:
+        image.load(image_file)
+    except Exception, e:
+        print 'Ignoring %s: %s: %s' % (image_file, type(e).__name__, e)
+        return False
+    return True
 
 def load_file(filename):
     with open(filename) as f:
@@ -22,7 +43,7 @@ def load_file(filename):
 def load_chunk(text):
     if text.startswith('+ '): # Method definition
         _, class_name, method_decl = text.split(None, 2)
-        raw_add_method(class_name, method_decl, terp.global_env)
+        raw_add_method(class_name, method_decl, terp.global_env, lazy=True)
     elif text.startswith('> '): # Command
         run(text[2:], terp.global_env)
     else:
@@ -30,17 +51,65 @@ def load_chunk(text):
 
 def add_change(chunk_type, text):
     if saving_changes:
-        changes.write(fileout.unparse1(chunk_type + ' ' + text) + '\n')
-        changes.flush()
+        changes.add(chunk_type + ' ' + text)
 
 def add_method(class_name, text, classes):
     raw_add_method(class_name, text, classes)
     add_change('+', class_name + ' ' + text)
 
-def raw_add_method(class_name, text, classes):
-    (selector, method), = parser.grammar.top_method(text)
-    method = terp.Method(text, method.code)
-    ensure_class(class_name, classes).put_method(selector, method)
+def raw_add_method(class_name, text, classes, lazy=False):
+    class_ = ensure_class(class_name, classes)
+    if lazy:
+        (selector, _), = parser.method_header(text)
+        method = LazyMethod(text, class_, selector)
+    else:
+        (selector, method), = parser.top_method(text)
+        method = terp.Method(text, method.code)
+    class_.put_method(selector, method)
+
+class LazyMethod(object):
+    """A method known only by its header till it's first called: then
+    its body gets parsed and compiled, and the real method replaces it."""
+    __slots__ = ('source', 'class_', 'selector', 'method')
+    def __init__(self, source, class_, selector):
+        self.source = source
+        self.class_ = class_
+        self.selector = selector
+        self.method = None
+    def parse(self):
+        if self.method is None:
+            (_, method), = parser.top_method(self.source)
+            self.method = terp.Method(self.source, method.code)
+        return self.method
+    @property
+    def code(self):
+        return self.parse().code
+    def __call__(self, receiver, arguments, k):
+        method = self.parse()
+        if self.class_.methods.get(self.selector) is self:
+            self.class_.put_method(self.selector, method)
+        return method(receiver, arguments, k)
+    def __repr__(self):
+        if self.method is None: return '<<unparsed %s>>' % self.selector
+        return repr(self.method)
+
+def print_bad_methods():
+    for class_name, selector, error in check_methods():
+        print 'Bad method %s %s: %s: %s' % (class_name, selector,
+                                             type(error).__name__, error)
+
+def check_methods():
+    "Parse all the methods not yet parsed; return (class, selector, error)s."
+    problems = []
+    for class_name, class_ in sorted(terp.global_env.rib.items()):
+        if not isinstance(class_, terp.Class): continue
+        for selector, method in sorted(class_.methods.items()):
+            if isinstance(method, LazyMethod):
+                try:
+                    method.parse()
+                except Exception, e:
+                    problems.append((class_name, selector, e))
+    return problems
 
 def ensure_class(name, classes):
     return classes.install(name, terp.Class({}, ()))
@@ -54,21 +123,59 @@ def parse_block(text, env):
 
 
 def make_class_method(_, (name, slots), k):
+    define_class(name, slots, None)
+    add_change('>', 'Make-class named: %r with-slots: %r' % (name, slots))
+    return k, name
+
+def make_subclass_method(_, (name, slots, superclass_name), k):
+    try:
+        superclass = terp.global_env.get(superclass_name)
+    except KeyError:
+        superclass = None
+    assert isinstance(superclass, terp.Class), \
+        "No class named %r to inherit from" % (superclass_name,)
+    define_class(name, slots, superclass)
+    add_change('>', 'Make-class named: %r with-slots: %r inheriting: %r'
+                    % (name, slots, superclass_name))
+    return k, name
+
+def define_class(name, slots, superclass):
     slot_tuple = tuple(slots.split()) # since we don't have Smalltalk arrays yet
+    if superclass is not None:
+        slot_tuple = superclass.slots + slot_tuple
 
     genv = terp.global_env
     old = ensure_class(name, genv)
-    if old.slots != slot_tuple:
-        old_methods = getattr(old, 'methods', {})
-        genv.adjoin(name, terp.Class(old_methods, slot_tuple))
-        # XXX for now we're leaving old instances alone, and they share
-        #  the method table. But their Thing data field ought to get updated
-        #  consistent with the change to slots (as far as possible). 
-    add_change('>', 'Make-class named: %r with-slots: %r' % (name, slots))
-    return k, name
-
-make_class_class = primitive.Class({'named:with-slots:': make_class_method}, ())
-make_class = primitive.Thing(make_class_class, ())
+    ancestor = superclass
+    while ancestor is not None:
+        assert ancestor is not old, "Class %r can't inherit from itself" % name
+        ancestor = ancestor.superclass
+    if old.slots != slot_tuple or old.superclass is not superclass:
+        for old_class, new_class in old.reshape(slot_tuple, superclass):
+            for method in new_class.methods.itervalues():
+                if isinstance(method, LazyMethod):
+                    method.class_ = new_class # to replace itself there
+            class_name = genv.find_value(old_class)
+            if class_name is not None:
+                genv.adjoin(class_name, new_class)
+        core.methods_changed()
+
+def define_method(class_, (text,), k):
+    "Add a method to class_ from its source text, as the editor would."
+    (selector, method), = parser.top_method(text)
+    class_.put_method(selector, terp.Method(text, method.code))
+    class_name = terp.global_env.find_value(class_)
+    if class_name is not None:
+        add_change('+', class_name + ' ' + text)
+    return k, selector
+
+primitive.Class.class_.put_method('define:', define_method)
+
+make_class_class = primitive.Class({
+    'named:with-slots:':            make_class_method,
+    'named:with-slots:inheriting:': make_subclass_method,
+}, (), name='Make-class class')
+make_class = make_class_class.make()
 
 terp.global_env.adjoin('Make-class', make_class)
 
@@ -81,6 +188,9 @@ terp.global_env.adjoin('Make-class', make_class)
 ## run("Make-class named: 'A' with-slots: 'a'", terp.global_env)
 #. 'A'
 
+## [core.get_class(run(text, terp.global_env)) for text in ['0 till: 2', 'Log', 'Process']]
+#. [Interval, Log, Process class]
+
 ## start_up()
 ## saving_changes = False
 
@@ -0,0 +1,82 @@
+"""
+Save and restore the global environment as an image file, to start up
+without parsing and running startup.hiss again.
+
+The objects made by our Python modules -- the primitive classes and
+such -- get saved by name and looked up again on loading, since the
+code that made them is running already; whatever methods the hiss code
+added to those classes gets saved along with the globals. Code saves
+as its AST and compiles again when first entered.
+"""
+
+import cPickle as pickle
+import os
+
+import core, fastparse, hiss, parser, primitive, process, profiler, streams, terp, typedarray
+
+modules = (core, primitive, terp, hiss, process, profiler, streams, typedarray)
+
+# The modules whose code decides what's in an image, whether or not
+# they contribute built-in objects: the parsers make the ASTs in it.
+code_modules = modules + (parser, fastparse)
+
+def builtins():
+    "Return a dict from name to each built-in object that can't be pickled."
+    result = {}
+    for module in modules:
+        for name, value in vars(module).items():
+            if isinstance(value, (primitive.Class, primitive.Thing, terp.Env,
+                                  streams.Log)):
+                result['%s.%s' % (module.__name__, name)] = value
+    for type_, class_ in core.class_from_type.items():
+        result['%s.%s.class_' % (type_.__module__, type_.__name__)] = class_
+    return result
+
+def save(filename):
+    names = dict((id(value), name) for name, value in builtins().items())
+    added_methods = [(class_, dict((selector, method)
+                                   for selector, method in class_.methods.items()
+                                   if isinstance(method, (terp.Method,
+                                                          hiss.LazyMethod))))
+                     for class_ in builtins().values()
+                     if isinstance(class_, primitive.Class)]
+    # Write a temp file and rename it into place, so that a failed
+    # save can't leave a broken image behind.
+    temp = filename + '.tmp'
+    try:
+        with open(temp, 'wb') as f:
+            pickler = pickle.Pickler(f, 2)
+            pickler.persistent_id = lambda obj: names.get(id(obj))
+            pickler.dump((terp.global_env.rib, added_methods))
+        os.rename(temp, filename)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+def load(filename):
+    table = builtins()
+    with open(filename, 'rb') as f:
+        unpickler = pickle.Unpickler(f)
+        unpickler.persistent_load = table.__getitem__
+        rib, added_methods = unpickler.load()
+    for name, value in rib.items():
+        terp.global_env.adjoin(name, value)
+    for class_, methods in added_methods:
+        class_.methods.update(methods)
+        class_.inherit_all()
+    core.methods_changed()
+
+def is_fresh(filename, sources):
+    "Is the image newer than all the sources it depends on?"
+    try:
+        saved = os.path.getmtime(filename)
+    except OSError:
+        return False
+    return all(os.path.getmtime(source) <= saved
+               for source in dependencies(sources))
+
+def dependencies(sources):
+    "The files an image made from these sources depends on."
+    return list(sources) + [os.path.splitext(module.__file__)[0] + '.py'
+                            for module in code_modules]
@@ -0,0 +1,140 @@
+"""
+The change journal: a log of the methods and classes accepted, in the
+fileout format, that can be replayed by hiss.load_file().
+
+Changes are batched and written under a durability policy:
+  'flush'     write and flush each change as it comes
+  'fsync'     also fsync it to disk
+  'interval'  write (and fsync) whatever's pending within interval
+              seconds, from a timer thread, and at exit
+Since only the latest definition of a method or class matters,
+compact() rewrites the journal down to just those.
+"""
+
+from collections import OrderedDict
+import atexit, os, re, threading, time
+
+import fileout, parser, parson
+
+class Journal(object):
+
+    def __init__(self, filename, policy='flush', interval=1.0):
+        assert policy in ('flush', 'fsync', 'interval'), policy
+        self.filename = filename
+        self.policy = policy
+        self.interval = interval
+        self.file = None        # Opened on the first write.
+        self.pending = []
+        self.lock = threading.Lock()    # On pending and the file, for the timer.
+        self.timer = None
+        self.last_commit = time.time()
+        self.index = None       # key -> ordinal of its latest chunk, once read.
+        self.count = None       # Number of chunks in the file, once read.
+        atexit.register(self.commit)
+
+    def add(self, chunk):
+        with self.lock:
+            self.pending.append(chunk)
+        wait = self.interval - (time.time() - self.last_commit)
+        if self.policy != 'interval' or wait <= 0:
+            self.commit()
+        elif self.timer is None:
+            self.timer = threading.Timer(wait, self.commit)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def commit(self):
+        "Write out the pending changes."
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.last_commit = time.time()
+        if not self.pending: return
+        if self.file is None:
+            self.file = open(self.filename, 'a')
+        self.file.write(''.join(fileout.unparse1(chunk) + '\n'
+                                for chunk in self.pending))
+        self.file.flush()
+        if self.policy != 'flush':
+            os.fsync(self.file.fileno())
+        if self.index is not None:
+            for chunk in self.pending:
+                self.index[chunk_key(chunk, self.count)] = self.count
+                self.count += 1
+        self.pending = []
+
+    def close(self):
+        self.commit()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def chunks(self):
+        try:
+            f = open(self.filename)
+        except IOError:
+            return
+        with f:
+            for chunk in fileout.parse(line.rstrip('\n') for line in f):
+                yield chunk
+
+    def read_index(self):
+        if self.index is None:
+            self.commit()
+            self.index, self.count = {}, 0
+            for chunk in self.chunks():
+                self.index[chunk_key(chunk, self.count)] = self.count
+                self.count += 1
+        return self.index
+
+    def stats(self):
+        "Return (chunks in the journal, how many are latest definitions)."
+        index = self.read_index()
+        return self.count, len(index)
+
+    def compact(self):
+        "Rewrite the journal keeping only the latest definition of each thing."
+        self.close()
+        latest = OrderedDict()  # Each kept at the place of its first definition.
+        for ordinal, chunk in enumerate(self.chunks()):
+            latest[chunk_key(chunk, ordinal)] = chunk
+        order = []
+        def put(key):
+            if key in latest:
+                chunk = latest.pop(key)
+                # A class must come after its superclass.
+                m = superclass_re.match(chunk)
+                if m: put(('class', m.group(1)))
+                order.append((key, chunk))
+        for key in list(latest):
+            put(key)
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as f:
+            for _, chunk in order:
+                f.write(fileout.unparse1(chunk) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp, self.filename)
+        self.index = dict((key, ordinal) for ordinal, (key, _) in enumerate(order))
+        self.count = len(order)
+
+make_class_re = re.compile(r"> Make-class named: (.*) with-slots: ")
+superclass_re = re.compile(r"> Make-class named: .* inheriting: (.*)$")
+
+def chunk_key(chunk, ordinal):
+    "What a chunk defines: later chunks with the same key supersede it."
+    if chunk.startswith('+ '):
+        _, class_name, method_decl = chunk.split(None, 2)
+        try:
+            (selector, _), = parser.method_header(method_decl)
+        except parson.Unparsable:
+            return ordinal
+        return ('+', class_name, selector)
+    m = make_class_re.match(chunk)
+    if m:
+        return ('class', m.group(1))
+    return ordinal              # Nothing supersedes any other command.
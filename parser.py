@@ -2,6 +2,8 @@
 Based on http://chronos-st.blogspot.com/2007/12/smalltalk-in-one-page.html
 """
 
+from collections import OrderedDict
+
 from parson import Grammar
 import terp
 from primitive import number_from_string
@@ -114,11 +116,11 @@ mk_block = terp.Code
 
 mk_then = terp.Then
 
-mk_return = lambda e: XXX
+mk_return = terp.Return
 
 def mk_cascade(operand, m1):
     send = m1(operand)
-    return terp.Cascade(send.subject, send.selector, send.operands)
+    return terp.make_cascade(send.subject, send.selector, send.operands)
 
 def mk_send(operand, m1):
     return m1(operand)
@@ -127,24 +129,66 @@ def mk_m1(selector, m1=lambda e: e):
     return lambda operand: m1(mk_e1(operand, selector))
 
 def mk_e1(operand, selector):
-    return terp.Send(operand, selector, ())
+    return terp.make_send(operand, selector, ())
 
 def mk_m2(selector, e1, m2=lambda e: e):
     return lambda operand: m2(mk_e2(operand, selector, e1))
 
 def mk_e2(operand, selector, arg):
-    return terp.Send(operand, selector, (arg,))
+    return terp.make_send(operand, selector, (arg,))
 
 def mk_m3(*args):
     selector = ''.join(args[::2])
     rands = args[1::2]
-    return lambda operand: terp.Send(operand, selector, rands)
+    return lambda operand: terp.make_send(operand, selector, rands)
 
 grammar = Grammar(grammar_text)(**globals())
 
+import fastparse
+
+# Parse with fastparse when we can, else with the grammar, which can
+# tell where the text goes wrong (by raising Unparsable).
+
+def top_code(text):
+    return fastparse.top_code(text) or grammar.top_code(text)
+
+def top_method(text):
+    return fastparse.top_method(text) or grammar.top_method(text)
+
+def method_header(text):
+    return fastparse.method_header(text) or grammar.method_header(text)
+
+# The same workspace text often gets run again and again (the REPL
+# even runs one line after every other, to spill the log), so
+# parse_code() keeps the Code for the most recently used texts. A Code,
+# once compiled, can be entered any number of times.
+
+code_cache = OrderedDict()      # text -> Code, least recently used first
+code_cache_size = 256
+code_cache_hits = code_cache_misses = 0
+
 def parse_code(text):
-    localvars, body = grammar.top_code(text)
-    return terp.Code((), localvars, body)
+    global code_cache_hits, code_cache_misses
+    try:
+        code = code_cache.pop(text)
+        code_cache_hits += 1
+    except KeyError:
+        code = compile_code(text)
+        code_cache_misses += 1
+        if code_cache_size <= len(code_cache):
+            code_cache.popitem(last=False)
+    code_cache[text] = code
+    return code
+
+def compile_code(text):
+    localvars, body = top_code(text)
+    code = terp.Code((), localvars, body)
+    code.compile_body(home=True)
+    return code
+
+def code_cache_stats():
+    "Return (hits, misses, texts cached)."
+    return code_cache_hits, code_cache_misses, len(code_cache)
 
 ## grammar.code('2 + 3 negate')
 #. ((), (2 + (3 negate)))
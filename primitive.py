@@ -2,33 +2,125 @@
 Primitive data types
 """
 from __future__ import division
-import itertools
+import gc, itertools, math, operator
 from collections import namedtuple
 
+import core
 from core import call, class_from_type
 
-class Thing(namedtuple('_Thing', 'class_ data')):
+# An instance of a hiss class is a list of its slots' values, of a
+# subtype of Thing made for its class, which gives its class_. The type
+# is a list, not a __slots__ record, so that reshape() can move an
+# instance to a new class with other slots in place: Python lets an
+# object change its __class__ only between types of the same layout.
+
+class Thing(list):
+    __slots__ = ()
+    class_ = None               # (Set in each class's own subtype.)
+    __hash__ = object.__hash__
+    def __eq__(self, other): return self is other
+    def __ne__(self, other): return self is not other
+    def __reduce__(self):
+        # The slots go in the state, as with Class below, since they
+        # may refer back to this Thing.
+        return make_instance, (self.class_,), list(self)
+    def __setstate__(self, values):
+        self[:] = values
     def get(self, key):
-        return self.data[self.class_.slot_index[key]]
+        return self[self.class_.slot_index[key]]
     def put(self, key, value):
-        self.data[self.class_.slot_index[key]] = value
+        self[self.class_.slot_index[key]] = value
     def __repr__(self):
-        return '%r(%s)' % (self.class_,
-                           ', '.join(map(repr, self.data)))
+        return '%r(%s)' % (self.class_, ', '.join(map(repr, self)))
+
+def make_instance(class_):
+    return class_.make()
+
+# A class's methods are just its own. Sends look up a selector in its
+# table instead, which holds the inherited methods too: so a lookup is
+# one dict probe however deep the class is. A change to any method
+# updates the tables of the class and of its subclasses below.
 
-class Class(namedtuple('_Class', 'methods slots')): # TODO a name slot too?
+class Class(namedtuple('_Class', 'methods slots')):
     class_ = None  # (stub, filled in below)
-    def __init__(self, methods, slots):
+    def __new__(cls, methods, slots, superclass=None, name=None):
+        return super(Class, cls).__new__(cls, methods, slots)
+    def __init__(self, methods, slots, superclass=None, name=None):
+        self.name = name        # For a native class with no global name.
+        self.superclass = superclass
+        self.subclasses = []
+        if superclass is None:
+            self.table = methods
+        else:
+            superclass.subclasses.append(self)
+            self.table = dict(superclass.table)
+            self.table.update(methods)
         self.slot_index = dict(zip(slots, range(len(slots))))
+        self.layout = type('Thing', (Thing,), dict(__slots__=(), class_=self))
     def get_method(self, selector):
         try:
-            return self.methods[selector]
+            return self.table[selector]
         except KeyError:
-            assert False, "Method %r unknown by %r" % (selector, self)
+            pass
+        if dnu_selector in self.table:
+            return lambda receiver, arguments, k: \
+                call(receiver, dnu_selector, (selector, list(arguments)), k)
+        assert False, "Method %r unknown by %r" % (selector, self)
     def put_method(self, selector, method):
         self.methods[selector] = method
+        self.inherit(selector)
+        core.methods_changed(selector)
+    def inherit(self, selector):
+        "Update the table entry for selector, here and in the subclasses."
+        method = self.methods.get(selector)
+        if method is None and self.superclass is not None:
+            method = self.superclass.table.get(selector)
+        if method is not None:
+            self.table[selector] = method
+        else:
+            self.table.pop(selector, None)
+        for subclass in self.subclasses:
+            subclass.inherit(selector)
+    def inherit_all(self):
+        "Rebuild the whole table, here and in the subclasses."
+        if self.superclass is not None:
+            self.table.clear()
+            self.table.update(self.superclass.table)
+            self.table.update(self.methods)
+        for subclass in self.subclasses:
+            subclass.inherit_all()
     def make(self):
-        return Thing(self, [None] * len(self.slots))
+        return self.layout([None] * len(self.slots))
+    def instances(self):
+        "Return my instances, found by a walk of the heap."
+        # Rather than a registry, which would cost every instance a
+        # weakref; this is for the rare reshape or query.
+        layout = self.layout
+        return [thing for thing in gc.get_objects() if type(thing) is layout]
+    def reshape(self, slots, superclass=None):
+        """Make a new Class like me but with these slots and superclass,
+        and move my instances over to it, keeping the values of the
+        slots we share. My subclasses get remade to inherit from it.
+        Return a list of (old class, new class), mine first."""
+        new = Class(self.methods, slots, superclass, self.name)
+        for thing in self.instances():
+            thing[:] = [thing.get(slot) if slot in self.slot_index else None
+                        for slot in slots]
+            thing.__class__ = new.layout
+        if self.superclass is not None:
+            self.superclass.subclasses.remove(self)
+        replaced = [(self, new)]
+        for subclass in list(self.subclasses):
+            own_slots = subclass.slots[len(self.slots):]
+            replaced += subclass.reshape(slots + own_slots, new)
+        return replaced
+    def __reduce__(self):
+        # The methods go in the state, after this Class is memoized,
+        # since a method may refer back to its class.
+        return Class, ({}, self.slots, self.superclass, self.name), self.methods
+    def __setstate__(self, methods):
+        self.methods.update(methods)
+        self.inherit_all()
     def next_method(self, selector, reverse=False):
         if selector not in self.methods:
             name = min(self.methods or (None,))
@@ -41,13 +133,22 @@ class Class(namedtuple('_Class', 'methods slots')): # TODO a name slot too?
         import terp
         name = terp.global_env.find_value(self)
         if name is not None: return name
+        if self.name is not None: return self.name
         return '<<Class %s | %s>>' % (' '.join(self.slots),
                                       self.methods)
 
 def new_method(receiver, arguments, k):
     return k, receiver.make()
 
-Class.class_ = Class(dict(new=new_method), ())
+dnu_selector = 'does-not-understand:arguments:'
+
+Class.class_ = Class({
+    'new':            new_method,
+    'superclass':     lambda class_, args, k: (k, class_.superclass),
+    'all-instances':  lambda class_, args, k: (k, class_.instances()),
+    'instance-count': lambda class_, args, k: (k, len(class_.instances())),
+}, ())
+class_from_type[Class] = Class.class_
 
 def cyclic_next(key, lot):
     it = itertools.cycle(lot)
@@ -59,7 +160,7 @@ def cyclic_next(key, lot):
 true_class = Class({}, ())   # Filled in at startup
 false_class = Class({}, ())  # ditto
 
-primitive_method_class = Class({}, ())  # TODO: fill this in
+primitive_method_class = Class({}, (), name='Primitive-method')  # TODO: fill this in
 
 def find_default(rcvr, (other, default), k):
     try:
@@ -90,6 +191,111 @@ def number_from_string(s):
 
 str_types = (str, unicode)
 
+# Loops over the elements of a string or array. Each step calls the
+# block with a continuation that takes the next step, so the loop goes
+# round through the trampoline: no Python recursion, and no sends but
+# the ones to the block.
+
+def do(rcvr, (block,), k):
+    return doing_k(None, (rcvr, block, 0), k)
+
+def doing_k(_, (rcvr, block, i), k):
+    if i < len(rcvr):
+        return call(block, 'value:', (rcvr[i],), (doing_k, (rcvr, block, i+1), k))
+    return k, None
+
+def do_with_index(rcvr, (block,), k):
+    return doing_with_index_k(None, (rcvr, block, 0), k)
+
+def doing_with_index_k(_, (rcvr, block, i), k):
+    if i < len(rcvr):
+        return call(block, 'value:value:', (rcvr[i], i),
+                    (doing_with_index_k, (rcvr, block, i+1), k))
+    return k, None
+
+def collect(rcvr, (block,), k):
+    return collect_from(rcvr, block, [], k)
+
+def collect_from(rcvr, block, results, k):
+    i = len(results)
+    if i < len(rcvr):
+        return call(block, 'value:', (rcvr[i],),
+                    (collecting_k, (rcvr, block, results), k))
+    return k, results
+
+def collecting_k(value, (rcvr, block, results), k):
+    results.append(value)
+    return collect_from(rcvr, block, results, k)
+
+def select(rcvr, (block,), k):
+    return select_from(rcvr, block, True, 0, [], k)
+
+def reject(rcvr, (block,), k):
+    return select_from(rcvr, block, False, 0, [], k)
+
+def select_from(rcvr, block, wanted, i, results, k):
+    if i < len(rcvr):
+        element = rcvr[i]
+        return call(block, 'value:', (element,),
+                    (selecting_k, (rcvr, block, wanted, i, results, element), k))
+    if isinstance(rcvr, str_types):
+        return k, ''.join(results)
+    return k, results
+
+def selecting_k(value, (rcvr, block, wanted, i, results, element), k):
+    if as_boolean(value) is wanted:
+        results.append(element)
+    return select_from(rcvr, block, wanted, i+1, results, k)
+
+def detect_default(rcvr, (block, default), k):
+    return detect_from(rcvr, block, default, 0, k)
+
+def detect_from(rcvr, block, default, i, k):
+    if i < len(rcvr):
+        element = rcvr[i]
+        return call(block, 'value:', (element,),
+                    (detecting_k, (rcvr, block, default, i, element), k))
+    return call(default, 'value', (), k)
+
+def detecting_k(value, (rcvr, block, default, i, element), k):
+    if as_boolean(value):
+        return k, element
+    return detect_from(rcvr, block, default, i+1, k)
+
+def as_boolean(thing):
+    if thing is True or thing is False:
+        return thing
+    assert False, "Not a boolean: %r" % (thing,)
+
+def inject_into(rcvr, (initial, block), k):
+    return injecting_k(initial, (rcvr, block, 0), k)
+
+def injecting_k(total, (rcvr, block, i), k):
+    if i < len(rcvr):
+        return call(block, 'value:value:', (total, rcvr[i]),
+                    (injecting_k, (rcvr, block, i+1), k))
+    return k, total
+
+def reverse_do(rcvr, (block,), k):
+    return reverse_doing_k(None, (rcvr, block, len(rcvr)), k)
+
+def reverse_doing_k(_, (rcvr, block, i), k):
+    if 0 < i:
+        return call(block, 'value:', (rcvr[i-1],),
+                    (reverse_doing_k, (rcvr, block, i-1), k))
+    return k, None
+
+iteration_methods = {
+    'do:':             do,
+    'do-with-index:':  do_with_index,
+    'collect:':        collect,
+    'select:':         select,
+    'reject:':         reject,
+    'detect:if-none:': detect_default,
+    'inject:into:':    inject_into,
+    'reverse-do:':     reverse_do,
+}
+
 string_methods = {
     'has:':  has,
     'at:':   at,
@@ -105,6 +311,7 @@ string_methods = {
     'string': myself,
     'number': to_number,
 }
+string_methods.update(iteration_methods)
 string_class = Class(string_methods, ())
 class_from_type[str] = string_class
 class_from_type[unicode] = string_class
@@ -131,11 +338,12 @@ array_methods = {
     '>':     gt,
     'append:': array_append,
 }
+array_methods.update(iteration_methods)
 array_class = Class(array_methods, ())
 class_from_type[list] = array_class
 
 nil_methods = {}
-nil_class = Class(nil_methods, ())
+nil_class = Class(nil_methods, (), name='Nil')
 class_from_type[type(None)] = nil_class
 
 num_types = (int, long, float)
@@ -156,7 +364,87 @@ num_methods = {
     '>': gt,
     'string': to_string,
     'number': myself,
+    'till:': lambda rcvr, (bound,), k: (k, Interval(rcvr, as_number(bound), 1, False)),
+    'thru:': lambda rcvr, (last,), k: (k, Interval(rcvr, as_number(last), 1, True)),
+    'till:by:': lambda rcvr, (bound, step), k:
+                    (k, Interval(rcvr, as_number(bound), as_number(step), False)),
+    'thru:by:': lambda rcvr, (last, step), k:
+                    (k, Interval(rcvr, as_number(last), as_number(step), True)),
 }
 num_class = Class(num_methods, ())
 for nt in num_types:
     class_from_type[nt] = num_class
+
+class Interval(object):
+    """The numbers first, first + step, ... on up to limit, or through
+    it if inclusive (or down, for a negative step)."""
+    __slots__ = ('first', 'limit', 'step', 'inclusive', 'size')
+    def __init__(self, first, limit, step, inclusive):
+        assert step != 0, "An interval can't step by 0"
+        self.first, self.limit, self.step = first, limit, step
+        self.inclusive = inclusive
+        span = limit - first
+        if isinstance(span, float) or isinstance(step, float):
+            # Allow for rounding, so 0 thru: 0.3 by: 0.1 reaches 0.3.
+            n = span / step
+            size = math.floor(n + 1e-9) + 1 if inclusive else math.ceil(n - 1e-9)
+        else:
+            size = span // step + 1 if inclusive else -(-span // step)
+        self.size = max(0, int(size))
+    def __len__(self):
+        return self.size
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError("Index %r out of range for size %d" % (i, self.size))
+        return self.first + i * self.step
+    def __repr__(self):
+        return '%r %s %r by: %r' % (self.first, 'thru:' if self.inclusive else 'till:',
+                                    self.limit, self.step)
+
+def interval_do(rcvr, (block,), k):
+    return counting_k(None, (rcvr.first, rcvr.step, 0, rcvr.size, block), k)
+
+def counting_k(_, (first, step, i, n, block), k):
+    # Each element computed afresh, as in Interval.__getitem__, so a
+    # fractional step doesn't pile up rounding errors.
+    if i < n:
+        return call(block, 'value:', (first + i * step,),
+                    (counting_k, (first, step, i + 1, n, block), k))
+    return k, None
+
+interval_methods = dict(iteration_methods)
+interval_methods.update({
+    'do:':    interval_do,
+    'at:':    at,
+    'size':   size,
+    'by:':    lambda rcvr, (step,), k: (k, Interval(rcvr.first, rcvr.limit,
+                                                    as_number(step), rcvr.inclusive)),
+    'array':  lambda rcvr, args, k: (k, list(rcvr)),
+})
+interval_class = Class(interval_methods, (), name='Interval')
+class_from_type[Interval] = interval_class
+
+# Compiled sends of these selectors do the arithmetic inline when both
+# operands are plain numbers, for as long as Number keeps the primitive
+# method.
+
+arith_ops = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '=': operator.eq,
+    '<': operator.lt,
+    '>': operator.gt,
+}
+
+def primitive_guard(class_, selector):
+    method = class_.methods[selector]
+    return core.Guard(selector, lambda: (class_.methods.get(selector) is method
+                                         and not core.watching))
+
+arith_guards = dict((selector, primitive_guard(num_class, selector))
+                    for selector in arith_ops)
+
+plain_num_types = frozenset(num_types)
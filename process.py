@@ -0,0 +1,114 @@
+"""
+Green threads: hiss processes, and channels to pass values between
+them. A process blocked on a wait or a receive parks its continuation
+with what it's waiting on and lets the next runnable process go. No
+OS threads are involved; core.trampoline does the time-slicing.
+"""
+
+from collections import deque
+
+import core
+from core import class_from_type, runnable
+import primitive, streams, terp
+
+class Process(object):
+    __slots__ = ('alive', 'done', 'result', 'error', 'waiters')
+    def __init__(self):
+        self.alive = True
+        self.done = False
+        self.result = None
+        self.error = None
+        self.waiters = []       # (owner, k) parked till we're done.
+    def finish(self, result):
+        self.alive = False
+        self.done, self.result = True, result
+        for owner, k in self.waiters:
+            runnable.append((owner, k, result))
+        self.waiters = []
+    def fail(self, error):
+        "Report the error, and pass it on to whoever waits for us."
+        self.alive = False
+        self.error = error
+        streams.log.write('Process failed: %s: %s\n' % (type(error).__name__, error))
+        for owner, k in self.waiters:
+            runnable.append((owner, (failing_k, error, k), None))
+        self.waiters = []
+    def __repr__(self):
+        if self.done: return '<Process done: %r>' % (self.result,)
+        if not self.alive: return '<Process failed>'
+        return '<Process>'
+
+def failing_k(_, error, k):
+    raise error
+
+def fork(_, (block,), k):
+    process = Process()
+    runnable.append((process,
+                     (starting_k, block, (core.ending_k, process, None)),
+                     None))
+    return k, process
+
+def starting_k(_, block, k):
+    return core.call(block, 'value', (), k)
+
+def yield_(_, args, k):
+    runnable.append((core.current, k, None))
+    return core.switch()
+
+def wait(process, args, k):
+    if process.done:
+        return k, process.result
+    if process.error is not None:
+        raise process.error
+    process.waiters.append((core.current, k))
+    return core.switch()
+
+process_class = primitive.Class({
+    'wait':    wait,
+    'is-done': lambda process, args, k: (k, process.done),
+}, (), name='Process')
+class_from_type[Process] = process_class
+
+make_process_class = primitive.Class({
+    'fork:': fork,
+    'yield': yield_,
+}, (), name='Process class')
+
+class Channel(object):
+    "An unbounded queue: sends never block, receives wait for a send."
+    __slots__ = ('items', 'receivers')
+    def __init__(self):
+        self.items = deque()
+        self.receivers = deque()    # (owner, k) parked till a send.
+    def __repr__(self):
+        return '<Channel %r>' % list(self.items)
+
+def send(channel, (value,), k):
+    receivers = channel.receivers
+    while receivers:
+        owner, receiver_k = receivers.popleft()
+        if owner.alive:
+            runnable.append((owner, receiver_k, value))
+            return k, None
+    channel.items.append(value)
+    return k, None
+
+def receive(channel, args, k):
+    if channel.items:
+        return k, channel.items.popleft()
+    channel.receivers.append((core.current, k))
+    return core.switch()
+
+channel_class = primitive.Class({
+    'send:':   send,
+    'receive': receive,
+    'size':    lambda channel, args, k: (k, len(channel.items)),
+}, (), name='Channel')
+class_from_type[Channel] = channel_class
+
+make_channel_class = primitive.Class({
+    'new': lambda _, args, k: (k, Channel()),
+}, (), name='Channel class')
+
+terp.global_env.adjoin('Process', make_process_class.make())
+terp.global_env.adjoin('Channel', make_channel_class.make())
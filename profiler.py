@@ -0,0 +1,185 @@
+"""
+Profiling hiss code: call counts and times per (class, selector).
+
+There are two modes. Timing mode watches every send (see core.watchers)
+and times each method from its call to its return. Sampling mode only
+marks each activation in the continuation chain; every so many
+trampoline steps it walks the chain, the way core.traceback does, and
+charges a sample to each method found there.
+"""
+
+import time
+
+import core, primitive, terp
+
+clock = time.time
+
+class Record(object):
+    "What we know about one (class, selector)."
+    __slots__ = ('class_', 'selector', 'calls',
+                 'inclusive', 'exclusive', 'samples', 'self_samples')
+    def __init__(self, class_, selector):
+        self.class_ = class_
+        self.selector = selector
+        self.calls = 0
+        self.inclusive = self.exclusive = 0.0
+        self.samples = self.self_samples = 0
+    def name(self):
+        return '%r %s' % (self.class_, self.selector)
+
+class Profiler(object):
+
+    def __init__(self):
+        self.mode = None
+        self.reset()
+
+    def reset(self):
+        self.records = {}       # (id(class_), selector) -> Record
+        self.stacks = {}        # owner -> [[record, start time, time in callees, live]]
+        self.active = {}        # (owner, record) -> its activations on owner's stack
+        self.samples = 0
+
+    def start(self, mode='timing'):
+        self.stop()
+        self.mode = mode
+        if mode == 'timing':
+            core.add_watcher(self.watch_timing)
+        elif mode == 'sampling':
+            core.add_watcher(self.watch_marking)
+            core.sampler = self.sample
+        else:
+            raise Exception("Unknown profiling mode", mode)
+
+    def stop(self):
+        core.remove_watcher(self.watch_timing)
+        core.remove_watcher(self.watch_marking)
+        if core.sampler == self.sample:
+            core.sampler = None
+        self.mode = None
+        self.stacks = {}
+        self.active = {}
+
+    def record(self, class_, selector):
+        key = id(class_), selector
+        try:
+            return self.records[key]
+        except KeyError:
+            record = self.records[key] = Record(class_, selector)
+            return record
+
+    # Timing mode
+
+    # Each process has its own stack of activations being timed, since
+    # processes take turns and one's returns don't come in order with
+    # another's. (The times are wall-clock, including any time the
+    # process spent waiting while others ran.)
+
+    def watch_timing(self, class_, selector, receiver, k):
+        record = self.record(class_, selector)
+        record.calls += 1
+        owner = core.current
+        self.active[owner, record] = self.active.get((owner, record), 0) + 1
+        entry = [record, clock(), 0.0, True]
+        self.stacks.setdefault(owner, []).append(entry)
+        return (timed_return_k, (self, owner, entry), k)
+
+    def leave(self, owner, entry):
+        # A ^ can skip the returns of the activations above entry; they
+        # end now too.
+        if not entry[3]: return
+        now = clock()
+        stack = self.stacks.get(owner, [])
+        while stack:
+            top = stack.pop()
+            record, start, in_callees, _ = top
+            top[3] = False
+            elapsed = now - start
+            active = self.active.pop((owner, record)) - 1
+            if active:
+                self.active[owner, record] = active
+            else:                   # Count recursive calls only once.
+                record.inclusive += elapsed
+            record.exclusive += elapsed - in_callees
+            if stack:
+                stack[-1][2] += elapsed
+            if top is entry:
+                break
+        if not stack:
+            self.stacks.pop(owner, None)
+
+    # Sampling mode
+
+    def watch_marking(self, class_, selector, receiver, k):
+        record = self.record(class_, selector)
+        record.calls += 1
+        return (marked_return_k, record, k)
+
+    def sample(self, k):
+        self.samples += 1
+        innermost = True
+        seen = set()
+        while k is not None:
+            fn, free_var, k = k
+            if fn is marked_return_k:
+                if innermost:
+                    free_var.self_samples += 1
+                    innermost = False
+                if id(free_var) not in seen:
+                    seen.add(id(free_var))
+                    free_var.samples += 1
+
+    # Reports
+
+    def calls_of(self, selector):
+        "How many sends of selector have been seen, to any class."
+        return sum(r.calls for r in self.records.values() if r.selector == selector)
+
+    def report(self, limit=25):
+        records = self.records.values()
+        if self.samples:
+            records.sort(key=lambda r: (-r.self_samples, -r.samples))
+            lines = ['%8s %8s %7s %7s  %s' % ('calls', 'samples', 'total%', 'self%', 'method')]
+            for r in records[:limit]:
+                lines.append('%8d %8d %6.1f%% %6.1f%%  %s'
+                             % (r.calls, r.samples,
+                                100.0 * r.samples / self.samples,
+                                100.0 * r.self_samples / self.samples,
+                                r.name()))
+        else:
+            records.sort(key=lambda r: -r.exclusive)
+            lines = ['%8s %10s %10s  %s' % ('calls', 'incl ms', 'excl ms', 'method')]
+            for r in records[:limit]:
+                lines.append('%8d %10.2f %10.2f  %s'
+                             % (r.calls, 1000 * r.inclusive, 1000 * r.exclusive,
+                                r.name()))
+        return '\n'.join(lines)
+
+def timed_return_k(value, (profiler, owner, entry), k):
+    profiler.leave(owner, entry)
+    return k, value
+
+def marked_return_k(value, record, k):
+    return k, value
+
+profiler = Profiler()
+
+def command(arg):
+    if   arg == 'on':     profiler.start('timing')
+    elif arg == 'sample': profiler.start('sampling')
+    elif arg == 'off':    profiler.stop()
+    elif arg == 'reset':  profiler.reset()
+    else: raise Exception("Unknown profiler command", arg)
+
+def unary(fn):
+    return lambda receiver, args, k: (k, fn())
+
+profiler_class = primitive.Class({
+    'start':          unary(lambda: profiler.start('timing')),
+    'start-sampling': unary(lambda: profiler.start('sampling')),
+    'stop':           unary(profiler.stop),
+    'reset':          unary(profiler.reset),
+    'report':         unary(profiler.report),
+    'calls-of:':      lambda receiver, (selector,), k: (k, profiler.calls_of(selector)),
+}, (), name='Profiler class')
+
+terp.global_env.adjoin('Profiler', profiler_class.make())
@@ -3,10 +3,10 @@ Read-eval-print loop, to aid debugging till the fancier UI is working.
 """
 
 import sys, traceback
-import core, hiss, parser, tinyhiss
+import core, hiss, parser, profiler, streams, terp, tinyhiss, tracedump, tracer
 
 def main(argv):
-    hiss.start_up()
+    hiss.start_up(check='--check' in argv)
     with open('transcript', 'a') as f:
         f.write('\n')
         repl(transcript=f)
@@ -32,16 +32,19 @@ def repl(show_traceback=True, show_parse=False, transcript=None):
                     exec arg
                 except Exception:
                     print traceback.format_exc()
+            elif cmd == 'c':
+                show_send_sites()
             elif cmd == 't':
+                trace_command(arg)
+            elif cmd == 'j':
+                journal_command(arg)
+            elif cmd == 'P':
                 if arg == '':
-                    core.tracing = not core.tracing
-                    print "Tracing %s" % ({True: 'on', False: 'off'}[core.tracing])
+                    print profiler.profiler.report()
+                elif arg in ('on', 'sample', 'off', 'reset'):
+                    profiler.command(arg)
                 else:
-                    tracing = {'on': True, 'off': False}.get(arg)
-                    if tracing is not None:
-                        core.tracing = tracing
-                    else:
-                        print "Unknown arg: %r" % arg
+                    print "Unknown arg: %r" % arg
             else:
                 print "Unknown command."
                 cmd_help()
@@ -60,16 +63,75 @@ def repl(show_traceback=True, show_parse=False, transcript=None):
         print comment + ' ' + result
         if transcript: transcript.write('--> %s\n' % result)
 
+def show_send_sites(limit=20):
+    hits, misses, size = parser.code_cache_stats()
+    print 'Parsed code cache: %d hits, %d misses, %d texts' % (hits, misses, size)
+    stats = core.send_site_stats()
+    stats.sort(key=lambda (_, __, hits, misses, ___): -(hits + misses))
+    print '%10s %10s %6s  %-11s %s' % ('hits', 'misses', 'hit%', 'state', 'send')
+    for selector, node, hits, misses, state in stats[:limit]:
+        print '%10d %10d %5.1f%%  %-11s %r' % (hits, misses,
+                                             100.0 * hits / (hits + misses),
+                                             state, node)
+
+def trace_command(arg):
+    t = tracer.tracer
+    words = arg.split()
+    if not words:
+        words = ['off' if t.is_on() else 'on']
+    cmd, args = words[0], words[1:]
+    if cmd == 'on':
+        t.start()
+    elif cmd == 'off':
+        t.stop()
+    elif cmd == 'clear':
+        t.clear()
+    elif cmd == 'show':
+        print tracedump.listing(t.snapshot(), int(args[0]) if args else 40)
+        return
+    elif cmd == 'sum':
+        print tracedump.summary(t.snapshot())
+        return
+    elif cmd == 'dump' and len(args) == 1:
+        t.dump(args[0])
+    elif cmd == 'only':
+        selectors, classes, max_depth = [], [], None
+        for word in args:
+            if word.isdigit():         max_depth = int(word)
+            elif word[:1].isupper():   classes.append(terp.global_env.get(word))
+            else:                      selectors.append(word)
+        t.set_filter(selectors or None, classes or None, max_depth)
+    else:
+        print "Unknown arg: %r" % arg
+        return
+    print "Tracing %s" % ('on' if t.is_on() else 'off')
+
+def journal_command(arg):
+    changes = hiss.changes
+    if arg == 'compact':
+        changes.compact()
+    elif arg == 'sync':
+        changes.commit()
+    elif arg != '':
+        print "Unknown arg: %r" % arg
+        return
+    count, live = changes.stats()
+    print "%s: %d changes, %d of them superseded" % (changes.filename,
+                                                    count, count - live)
+
 def spill_log():
-    s = tinyhiss.workspace_run("|s| s := Log show. Log clear. s")  # TODO no simpler code?
-    return s
+    return streams.log.spill()
 
 def cmd_help():
     print """\
   .? help
   ..        Reload startup.hiss
   .p stmt   Exec python stmt
-  .t arg?   Tracing on/off/toggle
+  .c        Show the hit rates of the parse cache and of the busiest send sites
+  .t arg?   Tracing on/off/toggle, or: clear, show [n], sum, dump file,
+            only [selector|Class|max-depth]... (no args: record everything)
+  .j arg?   Change journal: sync, compact; no arg shows its size
+  .P arg?   Profiler on/sample/off/reset; no arg shows the report
 """
 
 if __name__ == '__main__':
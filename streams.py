@@ -0,0 +1,127 @@
+"""
+Write streams: strings built up piece by piece. The global Log is one,
+which the REPL and the tests spill after each line; it can keep just
+its latest output, or stream it straight out to stdout or a file.
+"""
+
+import sys
+
+import core
+from core import class_from_type
+import primitive, terp
+
+class WriteStream(object):
+    "A growable string: the pieces written get joined only when asked for."
+    __slots__ = ('chunks', 'size')
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+    def write(self, s):
+        self.chunks.append(s)
+        self.size += len(s)
+    def contents(self):
+        if 1 < len(self.chunks):
+            self.chunks = [''.join(self.chunks)]
+        return self.chunks[0] if self.chunks else ''
+    def clear(self):
+        self.chunks = []
+        self.size = 0
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.contents())
+
+class Log(WriteStream):
+    """A WriteStream that keeps only its last limit characters, unless
+    limit is None, and that writes through to sink, unless sink is None."""
+    __slots__ = ('limit', 'sink')
+    def __init__(self, limit=None, sink=None):
+        WriteStream.__init__(self)
+        self.limit = limit
+        self.sink = sink
+    def write(self, s):
+        if self.sink is not None:
+            self.sink.write(s)
+            return
+        WriteStream.write(self, s)
+        if self.limit is not None and 2 * self.limit < self.size:
+            self.contents()
+    def contents(self):
+        text = WriteStream.contents(self)
+        if self.limit is not None and self.limit < len(text):
+            text = text[len(text) - self.limit:]
+            self.chunks, self.size = [text], len(text)
+        return text
+    def spill(self):
+        "Return what's been written since the last spill, and forget it."
+        if self.sink is not None:
+            self.sink.flush()
+        text = self.contents()
+        self.clear()
+        return text
+    def stream_to(self, name):
+        "Write through to stdout, or to the file of this name, or (if None) to me."
+        if self.sink not in (None, sys.stdout):
+            self.sink.close()
+        if name is None:
+            self.sink = None
+        elif name == 'stdout':
+            self.sink = sys.stdout
+        else:
+            self.sink = open(name, 'a')
+
+def say(stream, (x,), k):
+    if isinstance(x, primitive.str_types):
+        stream.write(x)
+    elif isinstance(x, primitive.num_types) and not isinstance(x, bool):
+        stream.write(str(x))
+    else:
+        return core.call(x, 'string', (), (saying_k, stream, k))
+    return k, None
+
+def saying_k(s, stream, k):
+    assert isinstance(s, primitive.str_types), \
+        "string answered a non-string: %r" % (s,)
+    stream.write(s)
+    return k, None
+
+def nl(stream, args, k):
+    stream.write('\n')
+    return k, None
+
+def clear(stream, args, k):
+    stream.clear()
+    return k, None
+
+def set_limit(log, (limit,), k):
+    log.limit = limit
+    return k, None
+
+def stream_to(log, (name,), k):
+    log.stream_to(name)
+    return k, None
+
+write_stream_methods = {
+    'say:':  say,
+    'nl':    nl,
+    'show':  lambda stream, args, k: (k, stream.contents()),
+    'clear': clear,
+    'size':  lambda stream, args, k: (k, len(stream.contents())),
+}
+write_stream_class = primitive.Class(write_stream_methods, (), name='WriteStream')
+class_from_type[WriteStream] = write_stream_class
+
+log_methods = dict(write_stream_methods)
+log_methods.update({
+    'limit:':     set_limit,
+    'stream-to:': stream_to,
+})
+log_class = primitive.Class(log_methods, (), name='Log')
+class_from_type[Log] = log_class
+
+make_write_stream_class = primitive.Class({
+    'new': lambda _, args, k: (k, WriteStream()),
+}, (), name='WriteStream class')
+
+log = Log()
+
+terp.global_env.adjoin('WriteStream', make_write_stream_class.make())
+terp.global_env.adjoin('Log', log)
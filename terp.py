@@ -4,12 +4,15 @@ AST interpreter
 
 from collections import namedtuple
 
-from core import call, class_from_type
+import core
+from core import SendSite, class_from_type
 import primitive
 from primitive import Class, Thing
 
 def make_method(params, locals_, expr, source=None):
-    return Method(source, Code(params, locals_, expr))
+    code = Code(params, locals_, expr)
+    code.compile_body(home=True)
+    return Method(source, code)
 
 class Method(namedtuple('_Method', 'source code')):
     # TODO: class_ = ...
@@ -21,6 +24,7 @@ class Method(namedtuple('_Method', 'source code')):
 block_methods = {
     'value':  lambda receiver, arguments, k: receiver.enter(arguments, k),
     'value:': lambda receiver, arguments, k: receiver.enter(arguments, k),
+    'value:value:': lambda receiver, arguments, k: receiver.enter(arguments, k),
 }
 
 class Block(namedtuple('_Block', 'me env code')):
@@ -29,19 +33,73 @@ class Block(namedtuple('_Block', 'me env code')):
         return self.code.enter(self.me, arguments, self.env, k)
     def __repr__(self):
         return 'Block(%r, %r, %r)' % (self.me, self.env, self.code)
+class_from_type[Block] = Block.class_
+
+
+# Each AST node compiles itself, once, into Python closures: compile(scope)
+# returns a pair (value, run). run(me, env, k) returns the next
+# trampoline state, as the old per-node eval() did. A node that never
+# needs a continuation (it has no sends inside) also gives value(me,
+# env), which just returns its value; otherwise value is None. Sends
+# use that to evaluate simple subexpressions in place instead of
+# bouncing through a continuation for each one.
+
+def simple(value):
+    def run(me, env, k):
+        return k, value(me, env)
+    return value, run
+
+def unbound(name):
+    return Exception("Unbound", name)
 
 class Code(namedtuple('_Code', 'params locals expr')):
     # TODO: class_ = ...
-    def eval(self, me, env, k):
-        return k, Block(me, env, self)
+    def compile_body(self, scope=None, home=False):
+        # The home code is a method's, or the whole of some code run
+        # from the workspace: where a ^ returns to. If there is any ^
+        # inside, the home frame gets an extra slot, home_k_name, to
+        # hold the continuation to return to.
+        self.scope, self.home = scope, home
+        self.__dict__.pop('enter', None)   # (See compile_later().)
+        names = self.params + self.locals
+        returns = home and has_return(self.expr)
+        if returns:
+            names += (home_k_name,)
+        if names:
+            scope = Scope(names, scope)
+        self.has_frame = bool(names)
+        self.nils = (None,) * (len(names) - len(self.params))
+        _, run = self.expr.compile(scope)
+        if returns:
+            index = len(names)
+            def run_home(me, env, k):
+                env[index] = k
+                return run(me, env, (home_return_k, (env, index), k))
+            self.run = run_home
+        else:
+            self.run = run
+    def compile_later(self, scope, home):
+        "Arrange to compile_body() on first entry."
+        def enter(*args):
+            self.compile_body(scope, home)
+            return self.enter(*args)
+        self.enter = enter
+    def __reduce__(self):
+        # Pickle just the AST, plus what it takes to compile it again.
+        return restore_code, (self.params, self.locals, self.expr,
+                              getattr(self, 'scope', None),
+                              getattr(self, 'home', False))
+    def compile(self, scope):
+        self.compile_body(scope)
+        code = self
+        return simple(lambda me, env: Block(me, env, code))
     def enter(self, me, arguments, parent_env, k):
         if len(self.params) != len(arguments):
             raise Exception("Block wants parameters %s but received %d arguments"
                             % (self.params, len(arguments)))
-        rib = dict(zip(self.params, arguments))
-        for name in self.locals:
-            rib[name] = None
-        return self.expr.eval(me, Env(rib, parent_env), k)
+        if self.has_frame:
+            parent_env = Frame((parent_env,) + tuple(arguments) + self.nils)
+        return self.run(me, parent_env, k)
     def __repr__(self):
         params = ' '.join(':'+param for param in self.params)
         if params: params += ' | '
@@ -49,85 +107,462 @@ class Code(namedtuple('_Code', 'params locals expr')):
         if locs: locs = '|%s| ' % locs
         return '{%s%s%r}' % (params, locs, self.expr)
 
+def restore_code(params, locals_, expr, scope, home):
+    code = Code(params, locals_, expr)
+    code.compile_later(scope, home)
+    return code
+
+home_k_name = '^'
+
+def has_return(node):
+    if isinstance(node, Return):
+        return True
+    return isinstance(node, tuple) and any(has_return(part) for part in node)
+
+class Return(namedtuple('_Return', 'expr')):
+    def compile(self, scope):
+        depth, index = scope_lookup(scope, home_k_name)
+        assert index is not None, "^ outside of any method"
+        value, run = self.expr.compile(scope)
+        if value is None:
+            return None, lambda me, env, k: run(me, env,
+                                                (returning_k, (up(env, depth), index), k))
+        return None, lambda me, env, k: returning_k(value(me, env),
+                                                    (up(env, depth), index), k)
+    def __repr__(self):
+        return '^ %r' % (self.expr,)
+
+# Once the home code has returned, its frame's home_k_name slot holds
+# dead_home instead of a continuation, for any ^ from a block that
+# outlived it.
+
+dead_home = object()
+
+def returning_k(value, (home_frame, index), _):
+    home_k = home_frame[index]
+    if home_k is dead_home:
+        raise Exception("Block cannot return: its home method has already returned")
+    home_frame[index] = dead_home
+    return home_k, value
+
+def home_return_k(value, (home_frame, index), k):
+    home_frame[index] = dead_home
+    return k, value
+
 class Self(namedtuple('_Self', '')):
-    def eval(self, me, env, k):
-        return k, me
+    def compile(self, scope):
+        return simple(lambda me, env: me)
     def __repr__(self):
         return 'I'
 
 class Constant(namedtuple('_Constant', 'value')):
-    def eval(self, me, env, k):
-        return k, self.value
+    def compile(self, scope):
+        value = self.value
+        return simple(lambda me, env: value)
     def __repr__(self):
         return repr(self.value)
 
-def with_key(key, thunk):
-    try: return thunk()
-    except KeyError:
-        raise Exception("Unbound", key)
-
 class GlobalGet(namedtuple('_GlobalGet', 'name')):
-    def eval(self, me, env, k):
-        return with_key(self.name, lambda: (k, global_env.get(self.name)))
+    def compile(self, scope):
+        name = self.name
+        cell = global_env.cell(name)
+        def global_get(me, env):
+            value = cell.value
+            if value is missing:
+                raise unbound(name)
+            return value
+        return simple(global_get)
     def __repr__(self):
         return str(self.name)
 
 class LocalGet(namedtuple('_LocalGet', 'name')):
-    def eval(self, me, env, k):
-        return with_key(self.name, lambda: (k, env.get(self.name)))
+    def compile(self, scope):
+        depth, index = scope_lookup(scope, self.name)
+        if index is None:
+            return simple(free_getter(depth, self.name))
+        return simple(frame_getter(depth, index))
     def __repr__(self):
         return str(self.name)
 
 class LocalPut(namedtuple('_LocalPut', 'name expr')):
-    def eval(self, me, env, k):
-        return self.expr.eval(me, env, (putting_k, (self.name, env), k))
+    def compile(self, scope):
+        name = self.name
+        depth, index = scope_lookup(scope, name)
+        value, run = self.expr.compile(scope)
+        if index is None:
+            if value is None:
+                return None, lambda me, env, k: run(me, env,
+                                                    (putting_k,
+                                                     (name, outer_env(env, depth, name)),
+                                                     k))
+            def free_put(me, env):
+                result = value(me, env)
+                try:
+                    outer_env(env, depth, name).put(name, result)
+                except KeyError:
+                    raise unbound(name)
+                return result
+            return simple(free_put)
+        if value is None:
+            return None, lambda me, env, k: run(me, env,
+                                                (frame_put_k,
+                                                 (up(env, depth), index), k))
+        if depth == 0:
+            def local_put(me, env):
+                env[index] = result = value(me, env)
+                return result
+        else:
+            def local_put(me, env):
+                up(env, depth)[index] = result = value(me, env)
+                return result
+        return simple(local_put)
     def __repr__(self):
         return '%s <- %r' % (self.name, self.expr)
 
+def frame_put_k(value, (frame, index), k):
+    frame[index] = value
+    return k, value
+
 def putting_k(value, (name, thing), k):
-    with_key(name, lambda: thing.put(name, value))
+    try:
+        thing.put(name, value)
+    except KeyError:
+        raise unbound(name)
     return k, value
 
+# A slot's offset in an instance depends only on the instance's type,
+# so each slot access caches the (type, offset) it last saw.
+
 class SlotGet(namedtuple('_SlotGet', 'name')):
-    def eval(self, me, env, k):
-        return with_key(self.name,
-                        lambda: (k, as_slottable(me).get(self.name)))
+    def compile(self, scope):
+        name = self.name
+        cache = [None, None]
+        def slot_get(me, env):
+            if type(me) is cache[0]:
+                return me[cache[1]]
+            return me[slot_offset(me, name, cache)]
+        return simple(slot_get)
     def __repr__(self):
         return 'my ' + str(self.name)
 
 class SlotPut(namedtuple('_SlotPut', 'name expr')):
-    def eval(self, me, env, k):
-        return self.expr.eval(me, env,
-                              (putting_k, (self.name, as_slottable(me)), k))
+    def compile(self, scope):
+        name = self.name
+        value, run = self.expr.compile(scope)
+        if value is None:
+            return None, lambda me, env, k: run(me, env,
+                                                (putting_k,
+                                                 (name, slottable(me, name)), k))
+        cache = [None, None]
+        def slot_put(me, env):
+            if type(me) is cache[0]:
+                index = cache[1]
+            else:
+                index = slot_offset(me, name, cache)
+            me[index] = result = value(me, env)
+            return result
+        return simple(slot_put)
     def __repr__(self):
         return 'my %s <- %r' % (self.name, self.expr)
 
+def slot_offset(thing, name, cache):
+    "Look up the offset of thing's slot name, and cache it by thing's type."
+    try:
+        index = as_slottable(thing).class_.slot_index[name]
+    except KeyError:
+        raise unbound(name)
+    cache[:] = type(thing), index
+    return index
+
 def as_slottable(thing):
     if not isinstance(thing, Thing):
         raise KeyError
     return thing
-    
+
+def slottable(thing, name):
+    try:
+        return as_slottable(thing)
+    except KeyError:
+        raise unbound(name)
+
+# Sends and cascades come in arity-specialized classes, made by
+# make_send() and make_cascade(); they differ only in how they compile.
+# When all the parts are simple, each evaluates them in place. Otherwise
+# the parts are gathered left to right by evparts(), which needs one
+# continuation per part that isn't simple, and the argument tuple is
+# built once at the end.
+
+def make_send(subject, selector, operands):
+    operands = tuple(operands)
+    return send_classes[min(len(operands), 3)](subject, selector, operands)
+
+def make_cascade(subject, selector, operands):
+    operands = tuple(operands)
+    return cascade_classes[min(len(operands), 3)](subject, selector, operands)
+
+def compile_send(node, scope):
+    site = SendSite(node.selector, node)
+    values, runs = compile_all((node.subject,) + node.operands, scope)
+    return None, node.specialize(site, values, runs)
+
+class Send(namedtuple('_Send', 'subject selector operands')):
+    def compile(self, scope):
+        return compile_send(self, scope)
+    def specialize(self, site, values, runs):
+        return gather(values, runs, (sending_k, site))
+    def __repr__(self):
+        return send_repr(self)
+
+class Send0(Send):
+    def specialize(self, site, values, runs):
+        subject, = values
+        if subject is None:
+            subject_run, = runs
+            return lambda me, env, k: subject_run(me, env, (sending0_k, site, k))
+        return lambda me, env, k: site.send(subject(me, env), (), k)
+
+def sending0_k(receiver, site, k):
+    return site.send(receiver, (), k)
+
+class Send1(Send):
+    def specialize(self, site, values, runs):
+        if inlinable(self):
+            return specialize_conditional(self, site, values, runs)
+        if self.selector in primitive.arith_ops:
+            return self.specialize_arith(site, values, runs)
+        subject, operand = values
+        if subject is None:
+            if operand is None:
+                return Send.specialize(self, site, values, runs)
+            subject_run = runs[0]
+            return lambda me, env, k: subject_run(me, env,
+                                                  (sending1_to_k,
+                                                   (site, operand, me, env), k))
+        if operand is None:
+            operand_run = runs[1]
+            return lambda me, env, k: operand_run(me, env,
+                                                  (sending1_k,
+                                                   (site, subject(me, env)), k))
+        return lambda me, env, k: site.send(subject(me, env),
+                                            (operand(me, env),), k)
+    def specialize_arith(self, site, values, runs):
+        op = primitive.arith_ops[self.selector]
+        guard = primitive.arith_guards[self.selector]
+        subject, operand = values
+        subject_run, operand_run = runs
+        if subject is None and operand is None:
+            return gather(values, runs, (arith_parts_k, (site, op, guard)))
+        if subject is None:
+            return lambda me, env, k: subject_run(me, env,
+                                                  (arith_to_k,
+                                                   (site, op, guard, operand, me, env),
+                                                   k))
+        if operand is None:
+            return lambda me, env, k: operand_run(me, env,
+                                                  (arith_k,
+                                                   (site, op, guard, subject(me, env)),
+                                                   k))
+        def arith(me, env, k):
+            receiver, arg = subject(me, env), operand(me, env)
+            if (guard.ok and type(receiver) in plain_num_types
+                         and type(arg) in plain_num_types):
+                return k, op(receiver, arg)
+            return site.send(receiver, (arg,), k)
+        return arith
+
+def sending1_k(arg, (site, receiver), k):
+    return site.send(receiver, (arg,), k)
+
+def sending1_to_k(receiver, (site, operand, me, env), k):
+    return site.send(receiver, (operand(me, env),), k)
+
+# The arithmetic fast paths, for when a part needs a continuation.
+
+plain_num_types = primitive.plain_num_types
+
+def arith_k(arg, (site, op, guard, receiver), k):
+    if (guard.ok and type(receiver) in plain_num_types
+                 and type(arg) in plain_num_types):
+        return k, op(receiver, arg)
+    return site.send(receiver, (arg,), k)
+
+def arith_to_k(receiver, (site, op, guard, operand, me, env), k):
+    return arith_k(operand(me, env), (site, op, guard, receiver), k)
+
+def arith_parts_k((receiver, arg), (site, op, guard), k):
+    return arith_k(arg, (site, op, guard, receiver), k)
+
+class Send2(Send):
+    def specialize(self, site, values, runs):
+        if inlinable(self):
+            return specialize_conditional(self, site, values, runs)
+        if None in values:
+            return Send.specialize(self, site, values, runs)
+        subject, operand1, operand2 = values
+        return lambda me, env, k: site.send(subject(me, env),
+                                            (operand1(me, env), operand2(me, env)),
+                                            k)
+
+class SendN(Send):
+    def specialize(self, site, values, runs):
+        if None in values:
+            return Send.specialize(self, site, values, runs)
+        subject, operands = values[0], values[1:]
+        return lambda me, env, k: site.send(subject(me, env),
+                                            tuple([operand(me, env)
+                                                   for operand in operands]),
+                                            k)
+
+send_classes = (Send0, Send1, Send2, SendN)
+
+# Conditionals. startup.hiss defines if-so:if-not: and friends as
+# ordinary methods of True and False; a send of one of them with
+# literal blocks as arguments compiles to a direct branch that never
+# makes the Block objects. boolean_inlines says what the startup
+# methods do: for each selector, (what True does, what False does),
+# where an int i means "evaluate argument block i", 'me' means "answer
+# the receiver" and None means "answer nil". A Guard per selector
+# checks that True and False still have methods doing just that; if
+# they don't, or the receiver isn't a boolean, the code deoptimizes to
+# an ordinary send.
+
+boolean_inlines = {
+    'if-so:if-not:': (0, 1),
+    'if-so:':        (0, None),
+    'if-not:':       (None, 0),
+    'and:':          (0, 'me'),
+    'or:':           ('me', 0),
+}
+
+def method_outcome(method):
+    "Return what method does, in the terms of boolean_inlines, or missing."
+    code = getattr(method, 'code', None)
+    if code is None or code.locals:
+        return missing
+    expr = code.expr
+    if isinstance(expr, Self):
+        return 'me'
+    if isinstance(expr, Constant) and expr.value is None:
+        return None
+    if (isinstance(expr, Send) and expr.selector == 'value'
+            and not expr.operands and isinstance(expr.subject, LocalGet)
+            and expr.subject.name in code.params):
+        return code.params.index(expr.subject.name)
+    return missing
+
+def boolean_guard(selector, (if_true, if_false)):
+    def test():
+        return (method_outcome(primitive.true_class.methods.get(selector)) == if_true
+                and method_outcome(primitive.false_class.methods.get(selector)) == if_false
+                and not core.watching)
+    return core.Guard(selector, test)
+
+def inlinable(send):
+    return (send.selector in boolean_inlines
+            and all(isinstance(operand, Code) and not operand.params
+                    for operand in send.operands))
+
+def specialize_conditional(send, site, values, runs):
+    guard = boolean_guards[send.selector]
+    if_true, if_false = [outcome_action(outcome, send.operands)
+                         for outcome in boolean_inlines[send.selector]]
+    blocks = values[1:]
+    subject = values[0]
+    if subject is None:
+        subject_run = runs[0]
+        free_var = (site, guard, if_true, if_false, blocks)
+        return lambda me, env, k: subject_run(me, env,
+                                              (conditional_k, (free_var, me, env), k))
+    def conditional(me, env, k):
+        receiver = subject(me, env)
+        if guard.ok:
+            if receiver is True:
+                return if_true(receiver, me, env, k)
+            if receiver is False:
+                return if_false(receiver, me, env, k)
+        return site.send(receiver, tuple([block(me, env) for block in blocks]), k)
+    return conditional
+
+def conditional_k(receiver, ((site, guard, if_true, if_false, blocks), me, env), k):
+    if guard.ok:
+        if receiver is True:
+            return if_true(receiver, me, env, k)
+        if receiver is False:
+            return if_false(receiver, me, env, k)
+    return site.send(receiver, tuple([block(me, env) for block in blocks]), k)
+
+def outcome_action(outcome, blocks):
+    if outcome is None:
+        return lambda receiver, me, env, k: (k, None)
+    if outcome == 'me':
+        return lambda receiver, me, env, k: (k, receiver)
+    code = blocks[outcome]
+    run = code.run
+    if not code.has_frame:
+        return lambda receiver, me, env, k: run(me, env, k)
+    nils = code.nils
+    return lambda receiver, me, env, k: run(me, Frame((env,) + nils), k)
+
 class Cascade(namedtuple('_Cascade', 'subject selector operands')):
-    def eval(self, me, env, k):
-        return self.subject.eval(me, env,
-                                 (cascade_evrands_k, (self, me, env), k))
+    def compile(self, scope):
+        return compile_send(self, scope)
+    def specialize(self, site, values, runs):
+        return gather(values, runs, (cascading_k, site))
     def __repr__(self):
         return send_repr(self, ';')
 
-def cascade_evrands_k(subject, (cascade, me, env), k):
-    return evrands(cascade.operands, me, env,
-                   (call_k, (subject, cascade),
-                    (ignore_k, subject, k)))
+class Cascade0(Cascade):
+    def specialize(self, site, values, runs):
+        subject, = values
+        if subject is None:
+            return Cascade.specialize(self, site, values, runs)
+        def cascade0(me, env, k):
+            receiver = subject(me, env)
+            return site.send(receiver, (), (ignore_k, receiver, k))
+        return cascade0
+
+class Cascade1(Cascade):
+    def specialize(self, site, values, runs):
+        if None in values:
+            return Cascade.specialize(self, site, values, runs)
+        subject, operand = values
+        def cascade1(me, env, k):
+            receiver = subject(me, env)
+            return site.send(receiver, (operand(me, env),), (ignore_k, receiver, k))
+        return cascade1
+
+class Cascade2(Cascade):
+    def specialize(self, site, values, runs):
+        if None in values:
+            return Cascade.specialize(self, site, values, runs)
+        subject, operand1, operand2 = values
+        def cascade2(me, env, k):
+            receiver = subject(me, env)
+            return site.send(receiver, (operand1(me, env), operand2(me, env)),
+                             (ignore_k, receiver, k))
+        return cascade2
+
+class CascadeN(Cascade):
+    def specialize(self, site, values, runs):
+        if None in values:
+            return Cascade.specialize(self, site, values, runs)
+        subject, operands = values[0], values[1:]
+        def cascade(me, env, k):
+            receiver = subject(me, env)
+            return site.send(receiver,
+                             tuple([operand(me, env) for operand in operands]),
+                             (ignore_k, receiver, k))
+        return cascade
+
+cascade_classes = (Cascade0, Cascade1, Cascade2, CascadeN)
 
 def ignore_k(_, result, k):
     return k, result
 
-class Send(namedtuple('_Send', 'subject selector operands')):
-    def eval(self, me, env, k):
-        return self.subject.eval(me, env,
-                                 (evrands_k, (self, me, env), k))
-    def __repr__(self):
-        return send_repr(self)
+def compile_all(nodes, scope):
+    "Compile nodes, returning (values, runs) with one entry per node."
+    pairs = [node.compile(scope) for node in nodes]
+    return tuple(value for value, _ in pairs), tuple(run for _, run in pairs)
 
 def send_repr(self, sep=''):
     subject = repr(self.subject)
@@ -139,34 +574,105 @@ def send_repr(self, sep=''):
         pairs = zip(self.selector.split(':'), self.operands)
         return '(%s%s%s)' % (subject, ''.join(' %s: %r' % pair for pair in pairs), sep)
 
-def evrands_k(subject, (send, me, env), k):
-    return evrands(send.operands, me, env,
-                   (call_k, (subject, send), k))
+def gather(values, runs, k_head):
+    "Compile evaluating all the parts into a list, then continuing to k_head."
+    finish_k, free_var = k_head
+    return lambda me, env, k: evparts(values, runs, 0, [], me, env,
+                                      (finish_k, free_var, k))
+
+def evparts(values, runs, i, results, me, env, k):
+    while i < len(values):
+        value = values[i]
+        if value is None:
+            return runs[i](me, env,
+                           (evparts_k, (values, runs, i, results, me, env), k))
+        results.append(value(me, env))
+        i += 1
+    return k, results
+
+def evparts_k(result, (values, runs, i, results, me, env), k):
+    results.append(result)
+    return evparts(values, runs, i+1, results, me, env, k)
+
+def sending_k(parts, site, k):
+    return site.send(parts[0], tuple(parts[1:]), k)
+
+def cascading_k(parts, site, k):
+    receiver = parts[0]
+    return site.send(receiver, tuple(parts[1:]), (ignore_k, receiver, k))
 
-def call_k(args, (subject, send_or_cascade), k):
-    return call(subject, send_or_cascade.selector, args, k)
+class Then(namedtuple('_Then', 'expr1 expr2')):
+    def compile(self, scope):
+        expr1, run1 = self.expr1.compile(scope)
+        expr2, run2 = self.expr2.compile(scope)
+        if expr1 is None:
+            return None, lambda me, env, k: run1(me, env,
+                                                 (then_k, (run2, me, env), k))
+        if expr2 is None:
+            def then(me, env, k):
+                expr1(me, env)
+                return run2(me, env, k)
+            return None, then
+        def then(me, env):
+            expr1(me, env)
+            return expr2(me, env)
+        return simple(then)
+    def __repr__(self):
+        return '%r. %r' % (self.expr1, self.expr2)
 
-def evrands(operands, me, env, k):
-    if not operands:
-        return k, ()
-    else:
-        return operands[0].eval(me, env,
-                                (evrands_more_k, (operands[1:], me, env), k))
+def then_k(_, (run2, me, env), k):
+    return run2(me, env, k)
 
-def evrands_more_k(val, (operands, me, env), k):
-    return evrands(operands, me, env, (evrands_cons_k, val, k))
 
-def evrands_cons_k(vals, val, k):
-    return k, (val,)+vals
+# Activation frames. A block or method with parameters or locals runs
+# in a Frame: a list whose element 0 is the enclosing environment and
+# whose remaining elements hold the variables, in the order of
+# params + locals. The compiler resolves each variable reference to a
+# (depth, index) pair: how many frames out, and where in that frame.
+# Names that aren't bound by any enclosing block are looked up by name
+# in whatever Env lies outside all the frames (the workspace, for
+# code run from there).
 
-class Then(namedtuple('_Then', 'expr1 expr2')):
-    def eval(self, me, env, k):
-        return self.expr1.eval(me, env, (then_k, (self, me, env), k))
+class Frame(list):
+    __slots__ = ()
     def __repr__(self):
-        return '%r. %r' % (self.expr1, self.expr2)
-
-def then_k(_, (then_, me, env), k):
-    return then_.expr2.eval(me, env, k)
+        return 'Frame(%r, %r)' % (list(self[1:]), self[0])
+
+Scope = namedtuple('Scope', 'names parent')
+
+def scope_lookup(scope, name):
+    "Return (depth, index) of name's frame slot, or (depth, None) if free."
+    depth = 0
+    while scope is not None:
+        if name in scope.names:
+            return depth, 1 + scope.names.index(name)
+        scope, depth = scope.parent, depth + 1
+    return depth, None
+
+def up(env, depth):
+    for _ in xrange(depth):
+        env = env[0]
+    return env
+
+def frame_getter(depth, index):
+    if depth == 0: return lambda me, env: env[index]
+    if depth == 1: return lambda me, env: env[0][index]
+    if depth == 2: return lambda me, env: env[0][0][index]
+    return lambda me, env: up(env, depth)[index]
+
+def outer_env(env, depth, name):
+    env = up(env, depth)
+    if env is None:
+        raise unbound(name)
+    return env
+
+def free_getter(depth, name):
+    def free_get(me, env):
+        try:
+            return outer_env(env, depth, name).get(name)
+        except KeyError:
+            raise unbound(name)
+    return free_get
 
 
 # Environments.  TODO move this elsewhere?
@@ -178,25 +684,27 @@ env_methods = {
 }
 
 class Env(namedtuple('_Env', 'rib container')):
-    class_ = Class(env_methods, ())
+    class_ = Class(env_methods, (), name='Env')
     # The following two methods are meant only for the global env and
     # the workspace. XXX This gets problematic when we expose local
     # envs to the user.
     def adjoin(self, key, value):
-        self.rib[key] = value
+        self.bind(key, value)
     def install(self, key, default):
         try:
             return self.get(key)
         except KeyError:
-            result = self.rib[key] = default
-            return result
+            self.bind(key, default)
+            return default
     def get(self, key):
-        return self.find(key)[key]
+        return self.find(key).rib[key]
     def put(self, key, value):
-        self.find(key)[key] = value
+        self.find(key).bind(key, value)
+    def bind(self, key, value):
+        self.rib[key] = value
     def find(self, key):
         if key in self.rib:
-            return self.rib
+            return self
         elif self.container is not None:
             return self.container.find(key)
         else:
@@ -212,18 +720,52 @@ class Env(namedtuple('_Env', 'rib container')):
     def __repr__(self):
         return 'Env(%r, %r)' % (self.rib, self.container)
 
-global_env = Env({}, None)
+class_from_type[Env] = Env.class_
+
+# The global env also keeps a binding cell for each name that compiled
+# code refers to. A GlobalGet fetches its cell once, at compile time,
+# and after that just reads it; every change to the binding goes
+# through bind() and so updates the cell.
+
+class Cell(object):
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+
+missing = object()              # The value of a cell with no binding yet.
+
+class GlobalEnv(Env):
+    def __init__(self, rib, container):
+        self.cells = {}
+    def bind(self, key, value):
+        self.rib[key] = value
+        cell = self.cells.get(key)
+        if cell is not None:
+            cell.value = value
+    def cell(self, key):
+        try:
+            return self.cells[key]
+        except KeyError:
+            cell = self.cells[key] = Cell(self.rib.get(key, missing))
+            return cell
+
+class_from_type[GlobalEnv] = Env.class_
+
+global_env = GlobalEnv({}, None)
+
+boolean_guards = dict((selector, boolean_guard(selector, outcomes))
+                      for selector, outcomes in boolean_inlines.items())
 
 def MakeArray(exprs):
-    subject = Send(GlobalGet('Make-array'), 'empty', ())
+    subject = make_send(GlobalGet('Make-array'), 'empty', ())
     for e in exprs:
-        subject = Cascade(subject, 'append:', (e,))
+        subject = make_cascade(subject, 'append:', (e,))
     return subject
 
 def make_array_empty_method(receiver, arguments, k): return k, []
 make_array_class = Class({'empty': make_array_empty_method},
-                         ())
-global_env.adjoin('Make-array', Thing(make_array_class, ()))
+                         (), name='Make-array class')
+global_env.adjoin('Make-array', make_array_class.make())
 
 #global_env.adjoin('Object', thing_class)
 global_env.adjoin('Block',  Block.class_)
@@ -0,0 +1,77 @@
+"""
+Check saving, loading and freshness of images: each start-up runs in a
+fresh Python process, with its image in a temp directory.
+Usage: python testimage.py
+"""
+
+import os, shutil, subprocess, sys, tempfile, time
+
+import hiss, image, terp
+
+def main(argv):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        check_all(os.path.join(temp_dir, 'test.image'))
+    finally:
+        shutil.rmtree(temp_dir)
+    print 'images ok'
+
+def check_all(filename):
+    # Start up with no image: it gets saved.
+    assert start_up(filename, '3 + 4') == '7'
+    assert os.path.exists(filename) and not os.path.exists(filename + '.tmp')
+
+    # What's added and saved comes back, methods, classes and all.
+    start_up(filename,
+             "Number define: 'triple  me * 3'. "
+             "Make-class named: 'Pair' with-slots: 'left right'. "
+             "Make-class named: 'Triple' with-slots: 'middle' inheriting: 'Pair'. "
+             "Globals at: 'Saved' adjoin: Triple new",
+             "hiss.image.save(%r)" % filename)
+    assert start_up(filename, '[3 triple. Saved. Triple superclass]') \
+        == '[9, Triple(None, None, None), Pair]'
+
+    # Freshness.
+    assert image.is_fresh(filename, [])
+    for module in ('parser.py', 'fastparse.py', 'terp.py'):
+        assert module in map(os.path.basename, image.dependencies([])), module
+    newer = filename + '.hiss'
+    time.sleep(0.01)
+    open(newer, 'w').close()
+    os.utime(newer, (time.time() + 1,) * 2)
+    assert not image.is_fresh(filename, [newer])
+    os.remove(newer)
+
+    # A save that fails leaves the old image alone.
+    with open(filename, 'rb') as f:
+        saved = f.read()
+    hiss.start_up(use_image=False, save_changes=False)
+    terp.global_env.adjoin('Unpicklable', lambda: None)
+    try:
+        image.save(filename)
+    except Exception:
+        pass
+    else:
+        assert False, "Saving a lambda should fail"
+    with open(filename, 'rb') as f:
+        assert f.read() == saved
+    assert not os.path.exists(filename + '.tmp')
+
+    # A broken image gets ignored, then replaced.
+    with open(filename, 'wb') as f:
+        f.write(saved[:len(saved) // 2])
+    output = start_up(filename, '3 + 4')
+    assert output.startswith('Ignoring ') and output.endswith('\n7'), output
+    assert start_up(filename, '3 + 4') == '7'
+
+def start_up(filename, text, then=''):
+    "In a new process, start up with this image, run text, and return the output."
+    script = ('import hiss, terp\n'
+              'hiss.image_file = %r\n'
+              'hiss.start_up(save_changes=False)\n'
+              'print hiss.run(%r, terp.global_env)\n'
+              '%s\n') % (filename, text, then)
+    return subprocess.check_output([sys.executable, '-c', script]).strip()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,76 @@
+"""
+Check the change journal: its policies, its index, and that a compacted
+journal still replays, each replay in a fresh Python process.
+Usage: python testjournal.py
+"""
+
+import os, shutil, subprocess, sys, tempfile, time
+
+import journal
+
+def main(argv):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        check_all(os.path.join(temp_dir, 'changes.hiss'))
+    finally:
+        shutil.rmtree(temp_dir)
+    print 'journals ok'
+
+shape = "> Make-class named: 'Shape' with-slots: 'x y'"
+circle = "> Make-class named: 'Circle' with-slots: 'radius' inheriting: 'Shape'"
+setter = "+ Circle radius: r\n  my radius := r.\n  me"
+area = "+ Circle area\n  my radius * my radius * 3"
+shape2 = "> Make-class named: 'Shape' with-slots: 'x y z'"
+area2 = "+ Circle area\n  my radius * my radius * 22 / 7"
+square = "> Make-class named: 'Square' with-slots: 'side'"
+corner = "> Make-class named: 'Corner' with-slots: 'x y'"
+square2 = "> Make-class named: 'Square' with-slots: 'side' inheriting: 'Corner'"
+
+def check_all(filename):
+    # A class redefined after its subclass, and a class that comes to
+    # inherit from one first defined after it.
+    j = journal.Journal(filename)
+    for chunk in (shape, circle, setter, area, shape2, area2, square, corner, square2):
+        j.add(chunk)
+    assert j.stats() == (9, 6)
+    expected = '[Circle(None, None, None, 7), 154.0, Shape, Corner]'
+    assert replay(filename) == expected
+    j.compact()
+    assert j.stats() == (6, 6)
+    assert read(filename) == [shape2, circle, setter, area2, corner, square2]
+    assert replay(filename) == expected
+    j.add(area)
+    assert j.stats() == (7, 6)
+    j.close()
+
+    # The interval policy writes within the interval, with no further adds.
+    os.remove(filename)
+    j = journal.Journal(filename, policy='interval', interval=0.1)
+    j.add(shape)
+    j.add(circle)
+    assert read(filename) == []
+    time.sleep(0.3)
+    assert read(filename) == [shape, circle]
+    j.close()
+
+    os.remove(filename)
+    j = journal.Journal(filename, policy='fsync')
+    j.add(shape)
+    assert read(filename) == [shape]
+    j.close()
+
+def read(filename):
+    return list(journal.Journal(filename).chunks())
+
+def replay(filename):
+    "In a new process, load the journal, then describe what it made."
+    script = ('import hiss, terp\n'
+              'hiss.start_up(use_image=False, save_changes=False)\n'
+              'hiss.load_file(%r)\n'
+              'print hiss.run("[Circle new radius: 7. (Circle new radius: 7) area. '
+              'Circle superclass. Square superclass]", terp.global_env)\n'
+              ) % filename
+    return subprocess.check_output([sys.executable, '-c', script]).strip()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,64 @@
+"""
+Check that methods loaded from a file get compiled on their first call,
+in every class that inherits them, and that --check finds the bad ones.
+Usage: python testlazy.py
+"""
+
+import os, shutil, subprocess, sys, tempfile
+
+import hiss, terp
+
+source = """\
+> Make-class named: 'Shape' with-slots: 'x'
+!
++ Shape size
+  7
+!
+> Make-class named: 'Circle' with-slots: 'radius' inheriting: 'Shape'
+!
+> Make-class named: 'Shape' with-slots: 'x y'
+!
++ Shape broken
+  1 +
+!
+"""
+
+def main(argv):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'lazy.hiss')
+        with open(filename, 'w') as f:
+            f.write(source)
+        check_all(filename)
+    finally:
+        shutil.rmtree(temp_dir)
+    print 'lazy methods ok'
+
+def check_all(filename):
+    hiss.start_up(use_image=False, save_changes=False)
+    hiss.load_file(filename)
+    shape, circle = terp.global_env.get('Shape'), terp.global_env.get('Circle')
+    assert repr(circle.table['size']) == '<<unparsed size>>'
+
+    # The first call, through the subclass reshaped since, compiles it
+    # for the superclass and the subclass both.
+    assert hiss.run('Circle new size', terp.global_env) == 7
+    for class_ in (shape, circle):
+        assert isinstance(class_.table['size'], terp.Method), class_
+    assert shape.methods['size'] is circle.table['size']
+
+    assert [(class_name, selector)
+            for class_name, selector, _ in hiss.check_methods()] \
+        == [('Shape', 'broken')]
+
+    # --check reports just the bad method.
+    script = ('import hiss\n'
+              'hiss.start_up(use_image=False, save_changes=False)\n'
+              'hiss.load_file(%r)\n'
+              'hiss.print_bad_methods()\n') % filename
+    output = subprocess.check_output([sys.executable, '-c', script]).strip()
+    assert output.startswith('Bad method Shape broken: '), output
+    assert len(output.splitlines()) == 1, output
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -8,21 +8,81 @@ Design criteria:
 
 Further wishlist, not satisfied yet:
 - some tests will need new methods, or new classes
-- some test isolation would be nice
 - easy to investigate a failing test
 
+Usage: python testme.py [-j jobs] [file[:line]]...  (or a file on stdin)
+The exit status is 1 if any test fails.
+
+Each section of a transcript (a run of lines between blank lines) is a
+test, run in its own worker process, forked from this one once it's
+started up: so tests can't leak state into each other, and they run
+in parallel. A file:line argument picks the test at that line.
+
 TODO it's ugly that we have two code formats: change files and these transcripts
 """
 
-import sys
+import multiprocessing, sys, time
 
-import hiss, tinyhiss
+import hiss, streams, tinyhiss
 
 loud = False
 
-def main():
-    hiss.start_up()
-    for line, outputs in group(chunks(nonempties(iter(sys.stdin)))):
+def main(argv):
+    jobs = None
+    if argv[1:2] == ['-j']:
+        jobs = int(argv[2])
+        argv = argv[2:]
+    tests = []
+    for arg in argv[1:] or ['-']:
+        tests.extend(load_tests(arg))
+    # The tests shouldn't leave an image or a change log behind.
+    hiss.start_up(use_image=False, save_changes=False)
+    pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+    timings, failures = [], 0
+    for name, elapsed, mismatches in pool.imap(run_test, tests):
+        print '%8.3fs %s' % (elapsed, name)
+        timings.append(elapsed)
+        failures += bool(mismatches)
+        for line, expected_outputs, outputs in mismatches:
+            print 'mismatch for', line
+            print '  expected:', repr(expected_outputs)
+            print '   but got:', repr(outputs)
+    pool.close()
+    pool.join()
+    print '%d tests, %.3fs total' % (len(timings), sum(timings))
+    if failures:
+        print '%d of them failed' % failures
+    return failures
+
+def load_tests(arg):
+    "Return the tests as (name, lines), from a file or a file:line."
+    filename, _, lineno = arg.partition(':')
+    if filename == '-':
+        text = sys.stdin.read()
+    else:
+        with open(filename) as f:
+            text = f.read()
+    tests = sections(filename, text.splitlines())
+    if lineno:
+        tests = [test for test in tests if test[2] <= int(lineno)][-1:]
+    return [(name, lines) for name, lines, _ in tests]
+
+def sections(filename, lines):
+    "Split into runs of nonblank lines, as (name, lines, first line number)."
+    result, start = [], None
+    for i, line in enumerate(lines + [''], 1):
+        if line.strip():
+            if start is None: start = i
+        elif start is not None:
+            result.append(('%s:%d' % (filename, start), lines[start-1:i-1], start))
+            start = None
+    return result
+
+def run_test((name, lines)):
+    "Replay one test; return (name, seconds taken, mismatches)."
+    start = time.time()
+    mismatches = []
+    for line, outputs in group(chunks(lines)):
         if loud: print repr(line), repr(outputs)
 
         comment, result = tinyhiss.print_it(line, show_traceback=False)
@@ -32,14 +92,11 @@ def main():
         expected_outputs.append(('-->', result))
 
         if outputs != expected_outputs:
-            print 'mismatch for', line
-            print '  expected:', repr(expected_outputs)
-            print '   but got:', repr(outputs)
+            mismatches.append((line, expected_outputs, outputs))
+    return name, time.time() - start, mismatches
 
-# XXX code dupe
 def spill_log():
-    s = tinyhiss.workspace_run("|s| s := Log show. Log clear. s")  # TODO no simpler code?
-    return s
+    return streams.log.spill()
 
 def group(chunks):
     "Group each input chunk with its output chunks."
@@ -53,11 +110,6 @@ def group(chunks):
             outputs.append((mark, item))
     if line is not None: yield line, outputs
 
-def nonempties(lines):
-    for line in lines:
-        line = line.rstrip('\n')
-        if line: yield line
-
 def chunks(lines):
     "Split each line into mark and item; group successive lines by mark."
     # TODO use itertools?
@@ -73,4 +125,4 @@ def chunks(lines):
     if chunk: yield prefix, '\n'.join(chunk)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(1 if main(sys.argv) else 0)
@@ -1 +1,7 @@
-python testme.py <testme.transcript
+status=0
+python testme.py <testme.transcript || status=1
+python testparse.py || status=1
+python testimage.py || status=1
+python testjournal.py || status=1
+python testlazy.py || status=1
+exit $status
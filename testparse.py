@@ -0,0 +1,156 @@
+"""
+Check that fastparse builds the same ASTs as the parson grammar does,
+and fails on the same texts: over startup.hiss, the workspace lines of
+testme.transcript, and a generated corpus, each also mangled at random.
+Usage: python testparse.py [number of programs to generate]
+Exits with status 1 on any mismatch.
+"""
+
+import random, sys
+
+import fastparse, fileout, parser, parson
+
+def main(argv):
+    count = int(argv[1]) if argv[1:] else 500
+    rng = random.Random(1234)
+    cases = list(startup_cases()) + list(transcript_cases())
+    cases += [('top_code', generate_code(rng)) for _ in range(count)]
+    cases += [(rule, mangle(rng, text)) for rule, text in cases for _ in range(3)]
+    tally = dict(same=0, fallback=0, mismatch=0)
+    for rule, text in cases:
+        outcome = compare(rule, text)
+        tally[outcome] += 1
+    print '%(same)d same, %(fallback)d left to the grammar, %(mismatch)d mismatches' % tally
+    check_code_cache()
+    print 'code cache ok'
+    return tally['mismatch']
+
+def startup_cases():
+    with open('startup.hiss') as f:
+        for chunk in fileout.parse(f.read().splitlines()):
+            if chunk.startswith('+ '):
+                yield 'top_method', chunk.split(None, 2)[2]
+            elif chunk.startswith('> '):
+                yield 'top_code', chunk[2:]
+
+def transcript_cases():
+    with open('testme.transcript') as f:
+        for line in f:
+            if line.startswith('> '):
+                yield 'top_code', line[2:].rstrip('\n')
+
+def compare(rule, text):
+    expected = outcome(getattr(parser.grammar, rule), text)
+    got = outcome(getattr(fastparse, rule), text)
+    if got == expected or (got is None and expected == 'unparsable'):
+        return 'same'
+    if got is None:
+        print 'fast parser declined %s %r' % (rule, text)
+        return 'fallback'
+    print 'mismatch for %s %r' % (rule, text)
+    print '  grammar:', expected
+    print '     fast:', got
+    return 'mismatch'
+
+def outcome(parse, text):
+    try:
+        result = parse(text)
+    except parson.Unparsable:
+        return 'unparsable'
+    except Exception, e:
+        return 'error: %s' % type(e).__name__
+    return None if result is None else shape(result)
+
+def shape(x):
+    "x's structure, with node types and leaf types spelled out."
+    if isinstance(x, tuple):
+        return (type(x).__name__,) + tuple(map(shape, x))
+    return type(x).__name__, x
+
+def check_code_cache():
+    "parse_code() reuses the Codes of recent texts, evicting the least recent."
+    saved_size = parser.code_cache_size
+    parser.code_cache.clear()
+    parser.code_cache_size = 2
+    try:
+        hits, misses, _ = parser.code_cache_stats()
+        one = parser.parse_code('1 + 2')
+        assert parser.parse_code('1 + 2') is one
+        two = parser.parse_code('3 + 4')
+        assert parser.parse_code('1 + 2') is one  # now the most recent
+        parser.parse_code('5 + 6')                # evicting '3 + 4'
+        assert list(parser.code_cache) == ['1 + 2', '5 + 6']
+        assert parser.parse_code('1 + 2') is one
+        assert parser.parse_code('3 + 4') is not two
+        assert parser.code_cache_stats() == (hits + 3, misses + 4, 2)
+    finally:
+        parser.code_cache_size = saved_size
+        parser.code_cache.clear()
+
+# A generator of random code, mostly well-formed.
+
+def generate_code(rng, depth=3):
+    text = ''
+    if rng.random() < .2:
+        text += '|%s| ' % ' '.join(generate_name(rng) for _ in range(rng.randint(0, 2)))
+    stmts = [generate_stmt(rng, depth) for _ in range(rng.randint(1, 3))]
+    return text + rng.choice(['. ', '.\n']).join(stmts) + rng.choice(['', '.', ' -- comment\n'])
+
+def generate_stmt(rng, depth):
+    r = rng.random()
+    if r < .15: return '%s := %s' % (generate_name(rng), generate_expr(rng, depth))
+    if r < .2:  return 'my %s := %s' % (generate_name(rng), generate_expr(rng, depth))
+    if r < .25: return '^ ' + generate_expr(rng, depth)
+    return generate_expr(rng, depth)
+
+def generate_expr(rng, depth):
+    text = generate_operand(rng, depth)
+    for _ in range(rng.choice([0, 1, 1, 2])):
+        text += generate_messages(rng, depth) + rng.choice(['', '; '])
+    return text
+
+def generate_messages(rng, depth):
+    text = ''.join(' ' + generate_name(rng) for _ in range(rng.randint(0, 2)))
+    for _ in range(rng.randint(0, 2)):
+        text += rng.choice([' ', '']) + rng.choice(binaries) + rng.choice([' ', ''])
+        text += generate_operand(rng, depth)
+    if rng.random() < .5:
+        for _ in range(rng.randint(1, 2)):
+            text += ' %s: %s' % (generate_name(rng), generate_operand(rng, depth))
+    return text or ' ' + generate_name(rng)
+
+def generate_operand(rng, depth):
+    r = rng.random()
+    if depth <= 0 or r < .3:
+        return rng.choice([generate_name(rng), generate_name(rng).capitalize(),
+                           rng.choice(['nil', 'true', 'false', 'I', 'me']),
+                           'my ' + generate_name(rng),
+                           rng.choice(['0', '42', '-7', '3.14', '1e-3', '2.5e3']),
+                           rng.choice(["''", "'hi'", "'it''s'", "' -- no comment'"])])
+    if r < .5:
+        params = [':' + generate_name(rng) for _ in range(rng.randint(0, 2))]
+        head = ' '.join(params) + ' | ' if params else ''
+        return '{%s%s}' % (head, generate_code(rng, depth - 1))
+    if r < .7:
+        return '(%s)' % generate_stmt(rng, depth - 1)
+    if r < .85:
+        return '[%s]' % '. '.join(generate_expr(rng, depth - 1)
+                                  for _ in range(rng.randint(0, 3)))
+    return generate_operand(rng, 0) + ' ' + generate_name(rng)
+
+names = ['x', 'y', 'foo', 'at', 'put', 'my-count', 'value', 'do', 'nilly', 'mine', 'i2']
+binaries = ['+', '-', '*', '<', '>=', '=', ',', '|', '->', '%', '++']
+
+def generate_name(rng):
+    return rng.choice(names)
+
+def mangle(rng, text):
+    "Damage text a little, somewhere."
+    i = rng.randint(0, len(text))
+    r = rng.random()
+    if r < .4: return text[:i] + text[i+1:]
+    if r < .8: return text[:i] + rng.choice(".:;|^'()[]{}-# \n=my") + text[i:]
+    return text[:i] + text[i:i+2][::-1] + text[i+2:]
+
+if __name__ == '__main__':
+    sys.exit(1 if main(sys.argv) else 0)
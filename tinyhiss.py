@@ -21,25 +21,67 @@ def main(ui):
 workspace_env = terp.Env({}, terp.global_env)
 
 def workspace_run(text):
+    return core.trampoline(workspace_start(text))
+
+def workspace_start(text):
+    "Return the trampoline state to start running text in the workspace."
     code = parser.parse_code(text)
     if isinstance(code.expr, terp.Constant) and code.expr.value is None:
         # Special case to add variables to the workspace. I know, yuck.
         for var in code.locals:
             workspace_env.install(var, None)
     block = terp.Block(None, workspace_env, code) # XXX redundant with hiss.run()
-    return core.trampoline(block.enter((), core.final_k))
+    return block.enter((), core.final_k)
 
 @bind(C('j'))
 def buf_print_it(buf):
+    buf.ui.abort_job()
     bol, eol = buf.start_of_line(buf.point), buf.end_of_line(buf.point)
     line = buf.text[bol:eol]
     # XXX hacky error-prone matching; move this to parser module
     old_result = buf.text.find(' --> ', bol, eol)
     if old_result == -1: old_result = buf.text.find(' --| ', bol, eol)
     if old_result == -1: old_result = eol
-    comment, result = print_it(line)
-    buf.replace(old_result, eol,
-                ' %s %s' % (comment, result.replace('\n', ' / ')))
+    buf.replace(old_result, eol, running_marker)
+    evaluation = Evaluation(buf)
+    try:
+        evaluation.run = core.Run(workspace_start(line))
+    except:
+        evaluation.fail()
+    else:
+        buf.ui.start_job(evaluation)
+
+# While a line is evaluating, this stands in for its result. The
+# evaluation runs a few slices at a time between keystrokes, so the
+# editor stays live, and C-g aborts it.
+running_marker = ' --> running...'
+
+class Evaluation(object):
+    slices = 50
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.run = None
+    def advance(self):
+        try:
+            done = self.run.advance(self.slices)
+        except:
+            self.fail()
+            return True
+        if done:
+            self.show('-->', repr(self.run.value))
+        return done
+    def abort(self):
+        self.run.abort()
+        self.show('--|', 'Interrupted')
+    def fail(self):
+        self.show('--|', format_exception(sys.exc_info()))
+    def show(self, comment, result):
+        buf = self.buf
+        start = buf.text.find(running_marker)
+        if start != -1:
+            buf.replace(start, start + len(running_marker),
+                        ' %s %s' % (comment, result.replace('\n', ' / ')))
 
 def print_it(line, show_traceback=False): # XXX of course this doesn't actually print
     try:
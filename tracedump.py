@@ -0,0 +1,46 @@
+"""
+Decode and summarize a trace dumped by tracer.py.
+Usage: python tracedump.py tracefile [-n count]
+"""
+
+import sys
+from collections import Counter
+
+import tracer
+
+def listing(trace, n=40):
+    "The last n records, indented by depth, timed from the first of them."
+    records = list(trace.records())[-n:]
+    if not records: return '(no sends traced)'
+    t0 = records[0][0]
+    return '\n'.join('%10.3f %3d %s%s %s' % (1000 * (t - t0), depth, '  ' * depth,
+                                              class_name, selector)
+                     for t, depth, selector, class_name in records)
+
+def summary(trace, n=20):
+    records = list(trace.records())
+    if not records: return '(no sends traced)'
+    span = records[-1][0] - records[0][0]
+    by_method = Counter((class_name, selector)
+                        for _, _, selector, class_name in records)
+    by_depth = Counter(depth for _, depth, _, _ in records)
+    lines = ['%d sends in %.3f ms (%d older ones overwritten)'
+             % (len(records), 1000 * span, trace.lost()),
+             '',
+             '%8s  %s' % ('sends', 'method')]
+    for (class_name, selector), count in by_method.most_common(n):
+        lines.append('%8d  %s %s' % (count, class_name, selector))
+    lines += ['', '%8s  %s' % ('sends', 'depth')]
+    for depth in sorted(by_depth):
+        lines.append('%8d  %d' % (by_depth[depth], depth))
+    return '\n'.join(lines)
+
+def main(argv):
+    trace = tracer.load(argv[1])
+    n = int(argv[3]) if argv[2:3] == ['-n'] else 40
+    print summary(trace)
+    print
+    print listing(trace, n)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,133 @@
+"""
+Tracing sends into a ring buffer of compact records, cheap enough to
+leave on: each send stores a selector id, a class id, a call depth,
+and a timestamp, overwriting the oldest record once the buffer's full.
+Dump the buffer to a file and read it back with tracedump.py.
+"""
+
+from array import array
+import cPickle as pickle
+import time
+
+import core
+
+clock = time.time
+
+class Tracer(object):
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.selector_ids = {}  # selector -> its index in self.selectors
+        self.selectors = []
+        self.class_ids = {}     # id(class_) -> its index in self.classes
+        self.classes = []
+        self.set_filter()
+        self.clear()
+
+    def clear(self):
+        self.codes = array('l', [0]) * (3 * self.capacity) # selector, class, depth
+        self.times = array('d', [0.0]) * self.capacity
+        self.count = 0          # Records ever made; the next goes at count % capacity.
+
+    def set_filter(self, selectors=None, classes=None, max_depth=None):
+        "Record only sends that pass all of the given tests."
+        self.selector_filter = None if selectors is None else set(selectors)
+        self.class_filter = None if classes is None else set(map(id, classes))
+        self.max_depth = max_depth
+
+    def start(self):
+        core.add_watcher(self.watch)
+
+    def stop(self):
+        core.remove_watcher(self.watch)
+
+    def is_on(self):
+        return self.watch in core.watchers
+
+    def watch(self, class_, selector, receiver, k):
+        depth = depth_of(k)
+        if ((self.max_depth is None or depth <= self.max_depth)
+            and (self.selector_filter is None or selector in self.selector_filter)
+            and (self.class_filter is None or id(class_) in self.class_filter)):
+            sid = self.selector_ids.get(selector)
+            if sid is None:
+                sid = self.selector_ids[selector] = len(self.selectors)
+                self.selectors.append(selector)
+            cid = self.class_ids.get(id(class_))
+            if cid is None:
+                cid = self.class_ids[id(class_)] = len(self.classes)
+                self.classes.append(class_)
+            i = self.count % self.capacity
+            j = 3 * i
+            codes = self.codes
+            codes[j], codes[j+1], codes[j+2] = sid, cid, depth
+            self.times[i] = clock()
+            self.count += 1
+            return (depth_k, depth, k)
+        return k
+
+    def fields(self):
+        return dict(selectors=self.selectors,
+                    class_names=map(repr, self.classes), # global or native names
+                    count=self.count, capacity=self.capacity,
+                    codes=self.codes.tostring(), times=self.times.tostring())
+
+    def snapshot(self):
+        return Trace(**self.fields())
+
+    def dump(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump(self.fields(), f, 2)
+
+# The depth of a call is found from the nearest marker in its
+# continuation, left by the recorded call it's nested in. (Unlike a
+# counter, this stays right across ^, errors, and process switches.)
+# Only recorded calls leave a marker, so the sends the filter skips
+# keep their tail calls, and depth counts recorded calls only.
+
+def depth_k(value, depth, k):
+    return k, value
+
+def depth_of(k):
+    while k is not None:
+        fn, free_var, k = k
+        if fn is depth_k:
+            return free_var + 1
+    return 0
+
+class Trace(object):
+    "A tracer's records, decoupled from the live tracer and its classes."
+
+    def __init__(self, selectors, class_names, count, capacity, codes, times):
+        self.selectors = selectors
+        self.class_names = class_names
+        self.count = count
+        self.capacity = capacity
+        self.codes = array('l'); self.codes.fromstring(codes)
+        self.times = array('d'); self.times.fromstring(times)
+
+    def lost(self):
+        "How many records got overwritten."
+        return max(0, self.count - self.capacity)
+
+    def records(self):
+        "Yield (time, depth, selector, class name), oldest first."
+        for n in range(self.lost(), self.count):
+            i = n % self.capacity
+            j = 3 * i
+            yield (self.times[i], self.codes[j+2],
+                   self.selectors[self.codes[j]], self.class_names[self.codes[j+1]])
+
+def load(filename):
+    with open(filename, 'rb') as f:
+        return Trace(**pickle.load(f))
+
+tracer = Tracer()
+
+
+# Smoke test
+
+## import hiss, terp
+## tracer.start(); hiss.run('(0 till: 2) do: {:i | Log say: i}', terp.global_env); tracer.stop()
+## sorted(set(name for _, _, _, name in tracer.snapshot().records()))
+#. ['Block', 'Interval', 'Log', 'Number']
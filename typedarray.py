@@ -0,0 +1,159 @@
+"""
+Typed arrays of numbers: FloatArray, IntArray and ByteArray, packed by
+the array module. Arithmetic and comparisons work on whole arrays at
+once, elementwise, against a number or another array of the same size;
+a comparison makes a ByteArray of 1s and 0s -- so even = answers a
+mask, not a boolean: ask == whether two arrays hold the same numbers.
+An element stored must fit the array's type. A slice shares its
+elements with the array it was sliced from.
+"""
+
+from array import array
+import itertools, operator, sys
+
+from core import class_from_type
+import primitive, terp
+
+class TypedArray(object):
+    "Elements start..stop of a packed array, which other slices may share."
+    __slots__ = ('items', 'start', 'stop')
+    typecode = None
+    def __init__(self, items, start=0, stop=None):
+        self.items = items
+        self.start = start
+        self.stop = len(items) if stop is None else stop
+    def __len__(self):
+        return self.stop - self.start
+    def __getitem__(self, i):
+        return self.items[self.offset(i)]
+    def __setitem__(self, i, value):
+        self.items[self.offset(i)] = element(self.typecode, value)
+    def offset(self, i):
+        if not 0 <= i < self.stop - self.start:
+            raise IndexError("Index %r out of range for size %d" % (i, len(self)))
+        return self.start + i
+    def values(self):
+        "Return a copy of my elements, as a packed array."
+        return self.items[self.start:self.stop]
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.values().tolist())
+
+class FloatArray(TypedArray):
+    __slots__ = ()
+    typecode = 'd'
+
+class IntArray(TypedArray):
+    __slots__ = ()
+    typecode = 'l'
+
+class ByteArray(TypedArray):
+    __slots__ = ()
+    typecode = 'B'
+
+array_types = dict((t.typecode, t) for t in (FloatArray, IntArray, ByteArray))
+
+int_ranges = {'l': (-sys.maxint - 1, sys.maxint), 'B': (0, 255)}
+
+def make(typecode, values):
+    return array_types[typecode](array(typecode, values))
+
+def element(typecode, value):
+    "Return value as an element for an array of typecode, or fail saying why."
+    value = primitive.as_number(value)
+    if typecode == 'd':
+        return float(value)
+    assert isinstance(value, (int, long)) or value.is_integer(), \
+        "Not an integer, for %s: %r" % (array_types[typecode].__name__, value)
+    lo, hi = int_ranges[typecode]
+    assert lo <= value <= hi, \
+        "%r out of range for %s" % (value, array_types[typecode].__name__)
+    return int(value)
+
+def operands(rcvr, other):
+    "Return rcvr's values, other's to match, and whether any are floats."
+    xs = rcvr.values()
+    if isinstance(other, TypedArray):
+        assert len(other) == len(xs), \
+            "Arrays differ in size: %d and %d" % (len(xs), len(other))
+        return xs, other.values(), 'd' in (rcvr.typecode, other.typecode)
+    other = primitive.as_number(other)
+    return xs, itertools.repeat(other, len(xs)), (rcvr.typecode == 'd'
+                                                  or isinstance(other, float))
+
+def arithmetic(op):
+    def method(rcvr, (other,), k):
+        xs, ys, floats = operands(rcvr, other)
+        typecode = 'd' if floats or op is operator.truediv else 'l'
+        return k, make(typecode, map(op, xs, ys))
+    return method
+
+def comparison(op):
+    def method(rcvr, (other,), k):
+        xs, ys, _ = operands(rcvr, other)
+        return k, make('B', map(op, xs, ys))
+    return method
+
+def dot(rcvr, (other,), k):
+    xs, ys, _ = operands(rcvr, other)
+    return k, sum(map(operator.mul, xs, ys))
+
+def fill(rcvr, (value,), k):
+    value = element(rcvr.typecode, value)
+    rcvr.items[rcvr.start:rcvr.stop] = array(rcvr.typecode, [value]) * len(rcvr)
+    return k, rcvr
+
+def same(rcvr, (other,), k):
+    return k, (isinstance(other, TypedArray)
+               and rcvr.values().tolist() == other.values().tolist())
+
+def from_till(rcvr, (first, bound), k):
+    assert 0 <= first <= bound <= len(rcvr), \
+        "Slice %d till: %d out of range for size %d" % (first, bound, len(rcvr))
+    return k, type(rcvr)(rcvr.items, rcvr.start + first, rcvr.start + bound)
+
+typed_array_methods = {
+    'at:':        primitive.at,
+    'at:put:':    primitive.at_put,
+    'size':       primitive.size,
+    '+':          arithmetic(operator.add),
+    '-':          arithmetic(operator.sub),
+    '*':          arithmetic(operator.mul),
+    '/':          arithmetic(operator.truediv),
+    '=':          comparison(operator.eq),
+    '<':          comparison(operator.lt),
+    '>':          comparison(operator.gt),
+    '==':         same,
+    'sum':        lambda rcvr, args, k: (k, sum(rcvr.values())),
+    'min':        lambda rcvr, args, k: (k, min(rcvr.values())),
+    'max':        lambda rcvr, args, k: (k, max(rcvr.values())),
+    'dot:':       dot,
+    'fill:':      fill,
+    'from:till:': from_till,
+    'array':      lambda rcvr, args, k: (k, rcvr.values().tolist()),
+}
+typed_array_methods.update(primitive.iteration_methods)
+
+float_array_class = primitive.Class(dict(typed_array_methods), (), name='FloatArray')
+int_array_class   = primitive.Class(dict(typed_array_methods), (), name='IntArray')
+byte_array_class  = primitive.Class(dict(typed_array_methods), (), name='ByteArray')
+class_from_type[FloatArray] = float_array_class
+class_from_type[IntArray]   = int_array_class
+class_from_type[ByteArray]  = byte_array_class
+
+def maker_class(typecode):
+    def new(_, (size,), k):
+        return k, array_types[typecode](array(typecode, [0]) * size)
+    def from_(_, (values,), k):
+        return k, make(typecode, [element(typecode, value) for value in values])
+    return primitive.Class({
+        'new:':  new,
+        'from:': from_,
+    }, (), name=array_types[typecode].__name__ + ' class')
+
+make_float_array_class = maker_class('d')
+make_int_array_class   = maker_class('l')
+make_byte_array_class  = maker_class('B')
+
+terp.global_env.adjoin('FloatArray', make_float_array_class.make())
+terp.global_env.adjoin('IntArray',   make_int_array_class.make())
+terp.global_env.adjoin('ByteArray',  make_byte_array_class.make())